@@ -0,0 +1,66 @@
+"""Benchmark Progression.factory on mixed sparse and dense frame sets.
+
+Run from the repo root:
+
+    PYTHONPATH=. python benchmarks/factory_benchmark.py [max_frames]
+
+Frames alternate between dense blocks (every frame) and sparse blocks
+(random gaps), which is the worst mix for the greedy splitter. The
+time per frame should stay flat as the number of frames grows.
+"""
+import random
+import sys
+import time
+
+from cioseq.sequence import Progression, Sequence
+
+
+def mixed_frames(count, block=500, seed=1):
+    """Return count sorted frames made of dense and sparse blocks."""
+    rnd = random.Random(seed)
+    frames = []
+    frame = 0
+    dense = True
+    while len(frames) < count:
+        for _ in range(min(block, count - len(frames))):
+            frames.append(frame)
+            frame += 1 if dense else rnd.randint(2, 9)
+        frame += 7
+        dense = not dense
+    return frames
+
+
+def timed(func, *args, **kw):
+    start = time.time()
+    result = func(*args, **kw)
+    return result, time.time() - start
+
+
+def main():
+    max_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 7
+    print(
+        "%12s %10s %12s %10s %12s %10s"
+        % ("frames", "progs", "list (s)", "ns/frame", "seq (s)", "ns/frame")
+    )
+    count = 10 ** 4
+    while count <= max_frames:
+        frames = mixed_frames(count)
+        seq = Sequence.create(frames)
+        progs, list_secs = timed(Progression.factory, frames)
+        _, seq_secs = timed(Progression.factory, seq)
+        print(
+            "%12d %10d %12.3f %10.1f %12.3f %10.1f"
+            % (
+                count,
+                len(progs),
+                list_secs,
+                list_secs * 1e9 / count,
+                seq_secs,
+                seq_secs * 1e9 / count,
+            )
+        )
+        count *= 10
+
+
+if __name__ == "__main__":
+    main()
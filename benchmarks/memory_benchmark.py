@@ -0,0 +1,85 @@
+"""Measure the memory held by Sequences and their chunks.
+
+Run from the repo root:
+
+    PYTHONPATH=. python benchmarks/memory_benchmark.py
+
+Memory is measured with tracemalloc, so it counts everything Python
+allocates for the objects, including their storage.
+"""
+import gc
+import random
+import tracemalloc
+
+from cioseq.sequence import Sequence, clear_chunk_cache
+
+
+def irregular_frames(count, seed=1):
+    """Return count frames with random gaps, so few progressions."""
+    rnd = random.Random(seed)
+    frames = []
+    frame = 0
+    for _ in range(count):
+        frames.append(frame)
+        frame += rnd.randint(1, 9)
+    return frames
+
+
+def random_half(count, seed=1):
+    """Return about half the frames up to count, chosen at random."""
+    rnd = random.Random(seed)
+    return [frame for frame in range(count) if rnd.random() < 0.5]
+
+
+def measure(func, *args):
+    """Return the result of func and the bytes it holds on to."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func(*args)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def make_chunks(seq):
+    return seq.chunks()
+
+
+def main():
+    print("%-34s %12s %14s" % ("test", "count", "bytes each"))
+
+    frames = irregular_frames(10 ** 6)
+    seq, size = measure(Sequence.create, frames)
+    print("%-34s %12d %14.1f" % ("irregular frames, per frame", len(seq), size / 1e6))
+
+    frames = random_half(2 * 10 ** 6)
+    seq, size = measure(Sequence.create, frames)
+    print(
+        "%-34s %12d %14.1f"
+        % ("random half (bitmap), per frame", len(seq), size / len(seq))
+    )
+
+    for strategy in ["linear", "cycle", "progressions"]:
+        clear_chunk_cache()
+        seq = Sequence.create(
+            irregular_frames(200000), chunk_size=10, chunk_strategy=strategy
+        )
+        chunks, size = measure(make_chunks, seq)
+        print(
+            "%-34s %12d %14.1f"
+            % ("%s chunks, per chunk" % strategy, len(chunks), size / len(chunks))
+        )
+
+    clear_chunk_cache()
+    seq = Sequence.create(1, 200000, chunk_size=10)
+    chunks, size = measure(make_chunks, seq)
+    print(
+        "%-34s %12d %14.1f"
+        % ("progression chunks, per chunk", len(chunks), size / len(chunks))
+    )
+
+
+if __name__ == "__main__":
+    main()
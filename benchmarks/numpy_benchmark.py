@@ -0,0 +1,84 @@
+"""Compare the pure Python and NumPy backends.
+
+Run from the repo root, with NumPy installed:
+
+    PYTHONPATH=. python benchmarks/numpy_benchmark.py [max_frames]
+
+Only work that touches every frame is timed. Specs, ranges, offset()
+and set operations on runs cost the same with either backend.
+"""
+import random
+import sys
+import time
+
+from cioseq.sequence import ChunkIndex, Sequence, set_backend
+
+
+def mixed_frames(count, seed=1):
+    """Return count shuffled frames made of ranges, steps and strays."""
+    rnd = random.Random(seed)
+    frames = []
+    frame = 0
+    while len(frames) < count:
+        step = rnd.choice([1, 1, 2, 3, 7])
+        for _ in range(rnd.randint(1, 200)):
+            frames.append(frame)
+            frame += step
+        frame += rnd.randint(1, 50)
+    frames = frames[:count]
+    rnd.shuffle(frames)
+    return frames
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def create(frames):
+    Sequence.create(frames)
+
+
+def subsample(seq):
+    seq.subsample(len(seq) // 2)
+
+
+def chunks_of(seq, frames):
+    ChunkIndex(seq).chunks_of(frames)
+
+
+def union(count):
+    Sequence.create(0, count * 2, 2).union(Sequence.create(0, count * 3, 3))
+
+
+def main():
+    max_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 7
+    tests = ["create", "subsample", "chunks_of", "union"]
+    print("%10s %10s %10s %10s %8s" % ("frames", "test", "python", "numpy", "speedup"))
+    count = 10 ** 4
+    while count <= max_frames:
+        frames = mixed_frames(count)
+        seq = Sequence.create(frames, chunk_size=100)
+        for test in tests:
+            secs = []
+            for backend in ["python", "numpy"]:
+                set_backend(backend)
+                if test == "create":
+                    secs.append(timed(create, frames))
+                elif test == "subsample":
+                    secs.append(timed(subsample, seq))
+                elif test == "chunks_of":
+                    secs.append(timed(chunks_of, seq, frames))
+                else:
+                    secs.append(timed(union, count))
+            print(
+                "%10d %10s %10.3f %10.3f %7.1fx"
+                % (count, test, secs[0], secs[1], secs[0] / max(secs[1], 1e-9))
+            )
+        count *= 10
+    set_backend("auto")
+
+
+if __name__ == "__main__":
+    main()
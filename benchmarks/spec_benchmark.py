@@ -0,0 +1,88 @@
+"""Compare greedy and optimal spec strings for irregular frame sets.
+
+Run from the repo root:
+
+    PYTHONPATH=. python benchmarks/spec_benchmark.py
+
+For each data set, prints the spec length and the time taken by
+Sequence.spec() in greedy and optimal mode.
+"""
+import random
+import time
+
+from cioseq.sequence import Sequence
+
+
+def random_sparse(count, seed=1):
+    rnd = random.Random(seed)
+    return sorted(rnd.sample(range(count * 4), count))
+
+
+def mixed_steps(count, seed=2):
+    """Short progressions with assorted steps and small gaps between."""
+    rnd = random.Random(seed)
+    frames = []
+    frame = 0
+    while len(frames) < count:
+        step = rnd.choice([1, 2, 3, 5, 10])
+        for _ in range(rnd.randint(2, 12)):
+            frames.append(frame)
+            frame += step
+        frame += rnd.randint(1, 15)
+    return frames[:count]
+
+
+def dense_with_failures(count, failures=0.002, seed=3):
+    """Every frame except a few scattered ones."""
+    rnd = random.Random(seed)
+    return [frame for frame in range(count) if rnd.random() > failures]
+
+
+def stepped_with_extras(count, seed=4):
+    """A stepped range with occasional extra frames."""
+    rnd = random.Random(seed)
+    frames = set(range(0, count * 2, 2))
+    frames.update(rnd.sample(range(1, count * 2, 2), count // 50))
+    return sorted(frames)
+
+
+DATA_SETS = [
+    ("random sparse", random_sparse),
+    ("mixed steps", mixed_steps),
+    ("dense with failures", dense_with_failures),
+    ("stepped with extras", stepped_with_extras),
+]
+
+
+def timed_spec(seq, mode):
+    start = time.time()
+    spec = seq.spec(mode=mode)
+    return spec, time.time() - start
+
+
+def main():
+    print(
+        "%-22s %9s %12s %10s %12s %10s %8s"
+        % ("data", "frames", "greedy len", "secs", "optimal len", "secs", "saved")
+    )
+    for name, func in DATA_SETS:
+        for count in [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]:
+            seq = Sequence.create(func(count))
+            greedy, greedy_secs = timed_spec(seq, "greedy")
+            optimal, optimal_secs = timed_spec(seq, "optimal")
+            print(
+                "%-22s %9d %12d %10.3f %12d %10.3f %7.1f%%"
+                % (
+                    name,
+                    len(seq),
+                    len(greedy),
+                    greedy_secs,
+                    len(optimal),
+                    optimal_secs,
+                    100.0 * (len(greedy) - len(optimal)) / len(greedy),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
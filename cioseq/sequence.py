@@ -6,6 +6,9 @@ frame spec: e.g. string  "1-10, 14, 20-50x4"
 range: one, two, or three integers representing start, end, step.
 iterable of ints: something that implements __iter__, e.g. a list.
 
+Specs, integer ranges, range objects and other Sequences are never
+expanded into frames, so Sequence.create(1, 10**9) is instant.
+
 Ranges in a spec are inclusive, e.g. len(Sequence("1-3")) == 3
 
 If the input is valid, either a Sequence or a Progression will
@@ -17,39 +20,793 @@ subsequences and are themselves of type, Sequence or
 Progression.
 
 """
+import array
+import bisect
+import collections
+import concurrent.futures
+import functools
+import heapq
 import math
+import operator
 import re
 import os
-from glob import glob
+import string
 import itertools
+import threading
+import time
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 RX_FRAME = re.compile(r"\$(\d?)F")
 
+RX_HASHES = re.compile(r"#+")
+
+RX_DOLLAR_F = re.compile(r"\$(\d?)F(\d?)", re.IGNORECASE)
+
+RX_INT_SPEC = re.compile(r"^\d*d?$")
+
 PROGRESSION_SPEC_REGEX = re.compile(
     r"^(?P<first>-?\d+)(-(?P<last>-?\d+)(x(?P<step>[1-9][0-9]*))?)?$"
 )
 
 SPLIT_SPEC_REGEX = re.compile(r"[ ,,]+")
 
+# A file name made of prefix, frame digits and an optional extension.
+FRAME_FILE_REGEX = re.compile(r"^(?P<prefix>.*?)(?P<frame>\d+)(?P<extension>\.[^.]*)?$")
+
+# Above this many frames, the optimal progression mode falls back to greedy.
+OPTIMAL_BUDGET = 1000000
+
+# Frames kept at each end of a run by the optimal progression mode.
+_OPTIMAL_RUN_EDGE = 3
+
+# Most chunks held by the chunk plan cache, across all Sequences.
+CHUNK_CACHE_LIMIT = 100000
+
+# Most directories held by the listing cache, once enabled.
+LISTING_CACHE_LIMIT = 1000
+
+# Listings taken this soon after a directory's mtime are not cached, as
+# files added in the same clock tick would not change the mtime.
+LISTING_CACHE_RACY_SECONDS = 2
+
+# Most compiled filename templates held at once.
+TEMPLATE_CACHE_LIMIT = 1024
+
+# Filenames written at a time by Sequence.expand_to().
+EXPAND_BLOCK_SIZE = 10000
+
+# Sequences with fewer runs than this are never stored as bitmaps.
+BITMAP_MIN_RUNS = 1024
+
+# Below this many frames, the auto backend stays in pure Python.
+NUMPY_THRESHOLD = 10000
+
+_backend = "auto"
+
+
+def set_backend(name):
+    """Choose the engine for work that touches every frame.
+
+    "python" always uses pure Python. "numpy" always uses NumPy, which
+    must be installed. "auto", the default, uses NumPy when it is
+    installed and there are at least NUMPY_THRESHOLD frames.
+
+    Most operations work on runs and never touch frames, so the backend
+    only matters for building from lists of frames, subsample(),
+    calc_fml(), unions of interleaved progressions and
+    ChunkIndex.chunks_of().
+    """
+    global _backend
+    if name not in ("auto", "numpy", "python"):
+        raise ValueError("Unknown backend: {}".format(name))
+    if name == "numpy" and numpy is None:
+        raise ImportError("The numpy backend needs NumPy to be installed")
+    _backend = name
+
+
+def get_backend():
+    """Return the name of the current backend. See set_backend()."""
+    return _backend
+
+
+def _use_numpy(size):
+    if numpy is None or _backend == "python":
+        return False
+    return _backend == "numpy" or size >= NUMPY_THRESHOLD
+
+
+def _int_array(values):
+    """Pack ints into an array of 64 bit ints.
+
+    Frames too big for 64 bits stay in a list.
+    """
+    values = list(values)
+    try:
+        return array.array("q", values)
+    except OverflowError:
+        return values
+
+
+try:
+    _popcount = int.bit_count
+except AttributeError:
+
+    def _popcount(bits):
+        return bin(bits).count("1")
+
+
+# The positions of the set bits in each byte value.
+_BYTE_BITS = [tuple(i for i in range(8) if byte >> i & 1) for byte in range(256)]
+
 
 def _clamp(minval, val, maxval):
     return sorted([minval, val, maxval])[1]
 
 
 
+def _escape_braces(text):
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def _positional_format(template):
+    """Rewrite {frame} fields in a format template as positional fields."""
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(_escape_braces(literal))
+        if field is None:
+            continue
+        if field == "frame" or field.startswith(("frame.", "frame[")):
+            field = "0" + field[len("frame") :]
+        parts.append("{" + field)
+        if conversion:
+            parts.append("!" + conversion)
+        if spec:
+            parts.append(":" + spec)
+        parts.append("}")
+    return "".join(parts)
+
+
+def _percent_format(pattern):
+    """Rewrite a positional format pattern with % fields if possible.
+
+    That works when every field is a frame as a padded integer, and %
+    is quicker. Returns the pattern and the number of fields, or None.
+    """
+    parts = []
+    count = 0
+    for literal, field, spec, conversion in string.Formatter().parse(pattern):
+        parts.append(literal.replace("%", "%%"))
+        if field is None:
+            continue
+        if field != "0" or conversion or not RX_INT_SPEC.match(spec):
+            return None
+        parts.append("%" + spec.rstrip("d") + "d")
+        count += 1
+    return "".join(parts), count
+
+
+def _format_fields(pattern, count, frame):
+    return pattern % ((frame,) * count)
+
+
+class FrameTemplate(object):
+    """A filename template compiled to a format string.
+
+    Use compile_template() to make one. The regex work is done once, so
+    format() does a single % or str.format for each frame.
+
+    Styles are:
+    hash: image.####.exr, where each group of hashes is a frame padded
+    to its length.
+    dollar: image.$4F.exr or image.$F4.exr, as in Clarisse and Houdini.
+    format: image.{frame:04d}.exr
+    """
+
+    __slots__ = ("template", "style", "pattern", "format", "_fields")
+
+    def __init__(self, template, style):
+        if style == "hash":
+            if not RX_HASHES.search(template):
+                raise ValueError("Template must contain hashes.")
+            parts = RX_HASHES.split(template)
+            fields = [
+                "{{0:0{:d}d}}".format(len(hashes))
+                for hashes in RX_HASHES.findall(template)
+            ]
+            pattern = _escape_braces(parts[0])
+            for field, part in zip(fields, parts[1:]):
+                pattern += field + _escape_braces(part)
+        elif style == "dollar":
+            pattern = _positional_format(
+                RX_DOLLAR_F.sub(
+                    lambda match: "{{frame:0{:d}d}}".format(
+                        int(match.group(2) or match.group(1) or 0)
+                    ),
+                    template,
+                )
+            )
+        elif style == "format":
+            pattern = _positional_format(template)
+        else:
+            raise ValueError("Unknown template style: {}".format(style))
+        self.template = template
+        self.style = style
+        self.pattern = pattern
+        self.format = pattern.format
+        self._fields = None
+        percent = _percent_format(pattern)
+        if percent is not None:
+            self.pattern, self._fields = percent
+            if self._fields == 1:
+                self.format = self.pattern.__mod__
+            else:
+                self.format = functools.partial(
+                    _format_fields, self.pattern, self._fields
+                )
+
+    def expand(self, frames):
+        """Return a filename for each frame."""
+        return list(map(self.format, frames))
+
+    def lines(self, frames):
+        """Return the filenames for a list of frames, each ending in a newline.
+
+        With one % field, the pattern is repeated and all the frames
+        are formatted in one go.
+        """
+        if self._fields == 1:
+            return (self.pattern + "\n") * len(frames) % tuple(frames)
+        return "".join([self.format(frame) + "\n" for frame in frames])
+
+    def __repr__(self):
+        return "FrameTemplate({!r}, {!r})".format(self.template, self.style)
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_LIMIT)
+def compile_template(template, style="hash"):
+    """Return a FrameTemplate, from a cache of recently used ones."""
+    return FrameTemplate(template, style)
+
+
+RX_MAPPING_FIELD = re.compile(r"%%|%\((\w+)\)|%")
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_LIMIT)
+def _positional_mapping(template, names):
+    """Rewrite a template with %(name) fields to take a tuple of values.
+
+    Returns the pattern and the position in names of the value for
+    each field, or None if some field is not one of names.
+    """
+    order = []
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%%"
+        if match.group(1) not in names:
+            raise KeyError(match.group(1))
+        order.append(names.index(match.group(1)))
+        return "%"
+
+    try:
+        return RX_MAPPING_FIELD.sub(replace, template), tuple(order)
+    except KeyError:
+        return None
+
+
+class Permutations(object):
+    """The filenames for all combinations of values of some Sequences.
+
+    Made by Sequence.permutations(). Combinations are ordered as in
+    itertools.product(), with the last keyword changing fastest.
+    Nothing is enumerated until needed. The i-th filename is found by
+    reading i as a mixed radix number with a digit for each keyword,
+    so shard() gives a worker its part without going through the
+    others. The template is compiled once, to a % with a tuple.
+
+    >>> template = "cam%(cam)d.%(frame)04d.exr"
+    >>> space = Sequence.permutations(template, cam="1-3", frame="1-100")
+    >>> len(space), space[101]
+    (300, 'cam2.0002.exr')
+    >>> part = space.shard(1, 4)
+    >>> len(part), part[0]
+    (75, 'cam1.0076.exr')
+    """
+
+    __slots__ = (
+        "template",
+        "names",
+        "sequences",
+        "_sizes",
+        "_start",
+        "_stop",
+        "_format",
+    )
+
+    def __init__(self, template, **kw):
+        self.template = template
+        self.names = tuple(kw)
+        self.sequences = tuple(
+            spec if isinstance(spec, Sequence) else Sequence.create(spec)
+            for spec in kw.values()
+        )
+        self._sizes = tuple(len(sequence) for sequence in self.sequences)
+        self._start = 0
+        self._stop = 1
+        for size in self._sizes:
+            self._stop *= size
+
+        compiled = _positional_mapping(template, self.names)
+        if compiled is None:
+            names = self.names
+            self._format = lambda values: template % dict(zip(names, values))
+        else:
+            pattern, order = compiled
+            if not order:
+                self._format = lambda values: pattern % ()
+            else:
+                arrange = operator.itemgetter(*order)
+                self._format = lambda values: pattern % arrange(values)
+
+    def _values(self, index):
+        """Return the values of each keyword for a combination."""
+        values = []
+        for sequence, size in zip(reversed(self.sequences), reversed(self._sizes)):
+            index, digit = divmod(index, size)
+            values.append(sequence[digit])
+        return tuple(reversed(values))
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("Permutation index out of range")
+        return self._format(self._values(self._start + index))
+
+    def __iter__(self):
+        """Generate the filenames in order.
+
+        The values of the other keywords are found once for each pass
+        over the values of the last.
+        """
+        if not self.sequences:
+            if self._start < self._stop:
+                yield self._format(())
+            return
+        last = self.sequences[-1]
+        size = self._sizes[-1]
+        index = self._start
+        while index < self._stop:
+            row, first = divmod(index, size)
+            count = min(size - first, self._stop - index)
+            values = self._values(row * size)[:-1]
+            for value in itertools.islice(last, first, first + count):
+                yield self._format(values + (value,))
+            index += count
+
+    def shard(self, k, n):
+        """Return the k-th of n nearly equal parts, as Permutations."""
+        if not 0 <= k < n:
+            raise ValueError("Shard must be in the range 0 to n - 1")
+        length = len(self)
+        shard = object.__new__(Permutations)
+        for name in Permutations.__slots__:
+            setattr(shard, name, getattr(self, name))
+        shard._start = self._start + length * k // n
+        shard._stop = self._start + length * (k + 1) // n
+        return shard
+
+    def __repr__(self):
+        return "Permutations({!r}, {})".format(
+            self.template,
+            ", ".join(
+                "{}={!r}".format(name, str(sequence))
+                for name, sequence in zip(self.names, self.sequences)
+            ),
+        )
+
+
 def _find_on_disk(prefix, extension):
-    REGEX_PATTERN = re.compile(r"{}(\d+){}".format(re.escape(prefix), re.escape(extension)))
-    GLOB_PATTERN = "{}*{}".format(prefix, extension)
-    
+    """Return the frames of files named prefix, digits, extension.
+
+    The prefix may include a directory.
+    """
+    directory, prefix = os.path.split(prefix)
+    return FrameScanner(directory).frames(prefix, extension)
+
+
+def _list_directory(directory):
+    """Return the names in a directory, or an empty list if unreadable."""
+    try:
+        with os.scandir(directory or ".") as entries:
+            return [entry.name for entry in entries]
+    except OSError:
+        return []
+
+
+_Listing = collections.namedtuple(
+    "_Listing", ["names", "files", "dirs", "links", "frames"]
+)
+
+
+def _read_directory(directory):
+    """Return a _Listing of a directory, which is empty if unreadable.
+
+    links are the links to directories, which are not in dirs. frames
+    is for FrameScanner to keep the frames it finds for each query.
+    """
+    files = []
+    dirs = []
+    links = []
+    try:
+        with os.scandir(directory or ".") as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry.name)
+                elif entry.is_symlink():
+                    links.append(entry.name)
+                else:
+                    dirs.append(entry.name)
+    except OSError:
+        pass
+    return _Listing(files + dirs + links, files, dirs, links, {})
+
+
+ListingCacheInfo = collections.namedtuple(
+    "ListingCacheInfo", ["hits", "misses", "limit", "size"]
+)
+
+
+class _ListingCache(object):
+    """Least recently used cache of directory listings.
+
+    Shared by the whole process and keyed by absolute path. A listing is
+    used while the device, inode and mtime of its directory are
+    unchanged, so a hit costs one stat. Adding or removing a file
+    changes the mtime. A limit of 0 means the cache is off.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._listings = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, directory):
+        path = os.path.abspath(directory or ".")
+        now = time.time()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        stamp = stat and (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._listings.get(path)
+            if stamp and entry and entry[0] == stamp:
+                self._listings.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            self._listings.pop(path, None)
+
+        listing = _read_directory(path)
+        if stamp and stat.st_mtime < now - LISTING_CACHE_RACY_SECONDS:
+            with self._lock:
+                self._listings[path] = (stamp, listing)
+                while len(self._listings) > self.limit:
+                    self._listings.popitem(last=False)
+        return listing
+
+    def set_limit(self, limit):
+        with self._lock:
+            self.limit = limit
+            while len(self._listings) > limit:
+                self._listings.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return ListingCacheInfo(
+                self.hits, self.misses, self.limit, len(self._listings)
+            )
+
+
+_listings = _ListingCache(0)
+
+
+def enable_listing_cache(limit=LISTING_CACHE_LIMIT):
+    """Cache directory listings used to find frames on disk.
+
+    Useful when the same directories are searched over and over, for
+    example while frames are being rendered into them. The cache holds
+    the listings of at most limit directories.
+    """
+    if limit < 1:
+        raise ValueError("Listing cache limit must be positive")
+    _listings.set_limit(limit)
+
+
+def disable_listing_cache():
+    """Stop caching directory listings, and drop those cached."""
+    _listings.set_limit(0)
+    _listings.clear()
+
+
+def clear_listing_cache():
+    """Drop all cached directory listings and reset the counters."""
+    _listings.clear()
+
+
+def listing_cache_info():
+    """Return the hits, misses, limit and size of the listing cache."""
+    return _listings.info()
+
+
+def _frames_in(names, prefix, extension):
+    """Return the frames of names made of prefix, digits, extension."""
+    first = len(prefix)
+    least = first + len(extension) + 1
     frames = []
-    files = glob(GLOB_PATTERN)
-    for file in files:
-        match = REGEX_PATTERN.match(file)
-        if match:
-            frames.append(int(match.group(1)))
+    for name in names:
+        if len(name) >= least and name.startswith(prefix) and name.endswith(extension):
+            digits = name[first : len(name) - len(extension)]
+            if digits.isdecimal():
+                frames.append(int(digits))
     return frames
 
-def _resolve_frames(*args, **kw):
+
+class FrameScanner(object):
+    """Find the frames of file sequences in one directory.
+
+    The directory is listed once, on the first query, so any number of
+    (prefix, extension) queries cost a single listing. Names are
+    matched with string operations rather than glob patterns. With the
+    listing cache enabled, the frames found are kept with the cached
+    listing, so repeating a query on an unchanged directory is free.
+
+    >>> scanner = FrameScanner("/path/to/images")
+    >>> scanner.find([("image.", ".exr"), ("image.", ".jpg")])
+    {('image.', '.exr'): [1, 2, 3], ('image.', '.jpg'): [1, 3]}
+    """
+
+    __slots__ = ("directory", "_names", "_found")
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._names = None
+        self._found = None
+
+    def names(self):
+        """Return the names of all entries in the directory."""
+        if self._names is None:
+            if _listings.limit:
+                listing = _listings.get(self.directory)
+                self._names, self._found = listing.names, listing.frames
+            else:
+                self._names, self._found = _list_directory(self.directory), {}
+        return self._names
+
+    def frames(self, prefix, extension):
+        """Return the unsorted frames of files named prefix, digits, extension."""
+        names = self.names()
+        frames = self._found.get((prefix, extension))
+        if frames is None:
+            frames = _frames_in(names, prefix, extension)
+            self._found[(prefix, extension)] = frames
+        return list(frames)
+
+    def find(self, queries):
+        """Return a dict of frames for each (prefix, extension) in queries."""
+        return {
+            (prefix, extension): self.frames(prefix, extension)
+            for prefix, extension in queries
+        }
+
+
+def _scan_directory(directory, followlinks=False):
+    """Return lists of the file names and directory names in a directory.
+
+    Links to directories are left out unless followlinks is set.
+    Both lists are empty if the directory can't be read.
+    """
+    if _listings.limit:
+        listing = _listings.get(directory)
+    else:
+        listing = _read_directory(directory)
+    if followlinks:
+        return listing.files, listing.dirs + listing.links
+    return listing.files, listing.dirs
+
+
+def _group_sequences(names):
+    """Group numbered file names into {(prefix, padding, extension): Sequence}.
+
+    Digits with a leading zero set the padding. Frames without one,
+    such as 1001 or 7, join the widest padding that still gives their
+    name. Any left over are grouped with the widest padding that gives
+    all their names, i.e. the width of the shortest.
+    """
+    groups = collections.defaultdict(list)
+    plain = collections.defaultdict(list)
+    for name in names:
+        match = FRAME_FILE_REGEX.match(name)
+        if not match:
+            continue
+        prefix, digits, extension = match.groups()
+        extension = extension or ""
+        if len(digits) > 1 and digits[0] == "0":
+            groups[(prefix, len(digits), extension)].append(int(digits))
+        else:
+            plain[(prefix, extension)].append((len(digits), int(digits)))
+
+    widths = collections.defaultdict(list)
+    for prefix, padding, extension in groups:
+        widths[(prefix, extension)].append(padding)
+    for (prefix, extension), frames in plain.items():
+        paddings = sorted(widths[(prefix, extension)])
+        rest = []
+        for width, frame in frames:
+            i = bisect.bisect_right(paddings, width)
+            if i:
+                groups[(prefix, paddings[i - 1], extension)].append(frame)
+            else:
+                rest.append((width, frame))
+        if rest:
+            padding = min(rest)[0]
+            groups[(prefix, padding, extension)].extend(frame for _, frame in rest)
+
+    return {key: Sequence.create(frames) for key, frames in groups.items()}
+
+
+def _scan_sequences(directory, followlinks):
+    """Return the sequences of a directory, and its subdirectories with
+    their ids. Ids are only looked up when following links."""
+    files, dirs = _scan_directory(directory, followlinks)
+    subdirs = []
+    for name in dirs:
+        subdir = os.path.join(directory, name)
+        subdirs.append((subdir, _directory_id(subdir) if followlinks else None))
+    return directory, _group_sequences(files), subdirs
+
+
+def _directory_id(path):
+    """Return (st_dev, st_ino) for a directory, or None if it can't be read."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+def find_sequences(root, max_workers=8, followlinks=False):
+    """Generate the file sequences in each directory under root.
+
+    Directories are listed in a pool of threads, as listing is I/O
+    bound on network filesystems. Each directory is listed once, and
+    as soon as it's done, yields (directory, sequences), where
+    sequences is a dict of (prefix, padding, extension) -> Sequence.
+    Directories with no numbered files are skipped. Directories are
+    yielded in no particular order.
+
+    With followlinks, links to directories are followed, but each
+    directory is scanned once, so links back up the tree don't loop.
+
+    >>> for directory, sequences in find_sequences("/shots/sh010"):
+    ...     for (prefix, padding, extension), seq in sequences.items():
+    ...         print(os.path.join(directory, prefix), padding, extension, seq)
+    /shots/sh010/render/beauty. 4 .exr 1001-1100
+    """
+    seen = {_directory_id(root)} if followlinks else set()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    pending = {executor.submit(_scan_sequences, root, followlinks)}
+    try:
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                directory, sequences, subdirs = future.result()
+                for subdir, directory_id in subdirs:
+                    if directory_id is not None:
+                        if directory_id in seen:
+                            continue
+                        seen.add(directory_id)
+                    pending.add(executor.submit(_scan_sequences, subdir, followlinks))
+                if sequences:
+                    yield directory, sequences
+    finally:
+        # The caller may stop early.
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _frames_named(names, prefix, suffix, field):
+    """Return the frames of names made of prefix, a frame, and suffix.
+
+    field formats a frame, e.g. "{0:04d}". Only names that give back
+    the same frame digits when formatted with field are matched.
+    """
+    first = len(prefix)
+    least = first + len(suffix) + 1
+    frames = []
+    for name in names:
+        if len(name) >= least and name.startswith(prefix) and name.endswith(suffix):
+            digits = name[first : len(name) - len(suffix)]
+            try:
+                frame = int(digits)
+            except ValueError:
+                continue
+            if field.format(frame) == digits:
+                frames.append(frame)
+    return frames
+
+
+def _present_in(directory, frames, base):
+    """Return the frames that have a file named by base in a directory.
+
+    base is a file name with hashes. With one group of hashes, frames
+    are read from the names in the directory. If frames is a Sequence,
+    they are not checked against it, as the caller will intersect.
+    """
+    names = FrameScanner(directory).names()
+    parts = re.split(r"(#+)", base)
+    if len(parts) == 3:
+        prefix, hashes, suffix = parts
+        field = "{{0:0{:d}d}}".format(len(hashes))
+        found = _frames_named(names, prefix, suffix, field)
+        if isinstance(frames, Sequence):
+            return found
+        wanted = set(frames)
+        return [frame for frame in found if frame in wanted]
+    names = set(names)
+    if "#" not in base:
+        return list(frames) if base in names else []
+    base = compile_template(base)
+    return [frame for frame in frames if base.format(frame) in names]
+
+
+def _big_enough(paths, min_size):
+    """Return a flag for each path that is a file of at least min_size bytes."""
+    flags = []
+    for path in paths:
+        try:
+            flags.append(os.stat(path).st_size >= min_size)
+        except OSError:
+            flags.append(False)
+    return flags
+
+
+# Paths are stat'ed in batches of this many per task.
+_STAT_BATCH = 1000
+
+
+def _resolve_runs(*args, **kw):
+    """Resolve the arguments given to create() to sorted runs.
+
+    Specs and integer ranges are never expanded into frames, so their
+    cost depends on the number of tokens rather than the number of
+    frames.
+    """
     if not args:
         prefix = kw.get("prefix")
         extension = kw.get("extension")
@@ -58,46 +815,1387 @@ def _resolve_frames(*args, **kw):
         frames = _find_on_disk(prefix, extension)
         if not frames:
             raise ValueError("No frames found on disk")
-        return sorted(set(frames))
-    frames = []
+        return _sorted_unique_runs(frames)
     if len(args) == 1:
         arg = args[0]
+        if isinstance(arg, Sequence):
+            return list(arg._runs())
+        if isinstance(arg, range):
+            if not arg:
+                return []
+            first, last = sorted([arg[0], arg[-1]])
+            return [_normalize_run(first, last, abs(arg.step))]
         if  hasattr(arg, "__iter__") and not isinstance(arg, (str, bytes )) :
-            frames = arg
-        else:
-            arg = str(arg)
-            for progression in SPLIT_SPEC_REGEX.split(arg):
-                match = PROGRESSION_SPEC_REGEX.match(progression)
-                if not match:
-                    raise ValueError("Arg must be 'start<-end<xstep>>")
-                first, last, step = [
-                    int(match.group("first")),
-                    int(match.group("last") or match.group("first")),
-                    int(match.group("step") or 1),
-                ]
-                if step < 1:
-                    raise ValueError("Spec must have positive step values")
-                first, last = sorted([first, last])
-                frames += range(first, last + 1, step)
+            return _sorted_unique_runs(arg)
+        runs = _parse_spec(str(arg))
     else:  # args are inclusive range
         first, last = sorted([int(n) for n in [args[0], args[1]]])
         step = int(args[2]) if len(args) == 3 else 1
         if step < 1:
             raise ValueError("Step arg must be positive")
-        frames = range(first, last + 1, step)
-    return sorted(set(frames))
+        runs = [(first, last, step)]
+    if len(runs) == 1:
+        return [_normalize_run(*runs[0])]
+    return _union_runs(runs)
+
+
+def _runs_of(iterable):
+    """Return the sorted runs of anything Sequence.create() accepts."""
+    if isinstance(iterable, Sequence):
+        return iterable._runs()
+    return _resolve_runs(iterable)
+
+
+def _iter_runs_of(iterable):
+    """Generate the sorted runs of anything Sequence.create() accepts.
+
+    The runs of a Sequence are read from its storage as they are
+    needed. Anything else is resolved to a list of runs first.
+    """
+    if isinstance(iterable, Sequence):
+        if isinstance(iterable._iterable, range):
+            return iter(iterable._runs())
+        return iterable._iterable.iter_runs()
+    return iter(_resolve_runs(iterable))
+
+
+def _operand_runs(iterable):
+    """Return the sorted runs of the other side of a set operation.
+
+    Returns None for a Sequence in a bitmap, whose runs are only listed
+    if bitmaps can't be combined. Anything else is read once here, as
+    it may be an iterator.
+    """
+    if isinstance(iterable, Sequence) and isinstance(
+        iterable._iterable, _FrameBitmap
+    ):
+        return None
+    return _runs_of(iterable)
+
+
+def _parse_spec(spec):
+    """Turn each token of a frame spec into a (start, end, step) run."""
+    runs = []
+    for progression in SPLIT_SPEC_REGEX.split(spec):
+        match = PROGRESSION_SPEC_REGEX.match(progression)
+        if not match:
+            raise ValueError("Arg must be 'start<-end<xstep>>")
+        first, last, step = [
+            int(match.group("first")),
+            int(match.group("last") or match.group("first")),
+            int(match.group("step") or 1),
+        ]
+        if step < 1:
+            raise ValueError("Spec must have positive step values")
+        first, last = sorted([first, last])
+        runs.append((first, last, step))
+    return runs
+
+
+def _normalize_run(start, end, step):
+    """Pull the end of a run back onto its last frame."""
+    end = start + ((end - start) // step) * step
+    return (start, end, step if end > start else 1)
+
+
+def _clip_run(start, end, step, lo, hi):
+    """Return the part of a run between lo and hi inclusive, or None."""
+    if lo > start:
+        start += -(-(lo - start) // step) * step
+    end = min(end, hi)
+    if start > end:
+        return None
+    return _normalize_run(start, end, step)
+
+
+def _union_runs(runs):
+    """Merge runs in any order into sorted, non-interleaving runs.
+
+    Runs whose spans do not overlap are kept as they are. Within a
+    group of overlapping runs, the step 1 runs are merged as intervals
+    and the stepped runs are clipped to the gaps between them. Only
+    stepped runs that still overlap, and do not contain one another,
+    are expanded into frames.
+    """
+    return _coalesce_runs(_iter_union(sorted(_normalize_run(*run) for run in runs)))
+
+
+def _iter_union(runs):
+    """Merge normalized runs sorted by start, one group at a time.
+
+    Only the current group of overlapping runs is held. Overlapping
+    step 1 runs are merged on arrival, so a stream of plain ranges
+    needs constant memory. The merged runs are not coalesced.
+    """
+    cluster = []
+    cluster_end = None
+    for run in runs:
+        if cluster and run[0] > cluster_end:
+            for merged in _union_cluster(cluster):
+                yield merged
+            cluster = []
+        if not cluster or run[1] > cluster_end:
+            cluster_end = run[1]
+        if run[2] == 1 and cluster and cluster[-1][2] == 1 and run[0] <= cluster[-1][1]:
+            cluster[-1] = (cluster[-1][0], max(cluster[-1][1], run[1]), 1)
+        else:
+            cluster.append(run)
+    for merged in _union_cluster(cluster):
+        yield merged
+
+
+def _union_cluster(cluster):
+    """Merge sorted runs whose spans overlap. See _union_runs()."""
+    if len(cluster) < 2:
+        return cluster
+
+    intervals = []
+    stepped = []
+    for run in cluster:
+        if run[2] == 1:
+            if intervals and run[0] <= intervals[-1][1] + 1:
+                if run[1] > intervals[-1][1]:
+                    intervals[-1] = (intervals[-1][0], run[1], 1)
+            else:
+                intervals.append(run)
+        else:
+            stepped.append(run)
+
+    # Clip the stepped runs to the gaps between intervals.
+    starts = [interval[0] for interval in intervals]
+    pieces = []
+    for start, end, step in stepped:
+        lo = start
+        i = max(bisect.bisect_right(starts, start) - 1, 0)
+        while lo <= end:
+            if i < len(intervals) and intervals[i][1] < lo:
+                i += 1
+                continue
+            if i < len(intervals) and intervals[i][0] <= lo:
+                lo = intervals[i][1] + 1
+                i += 1
+                continue
+            hi = intervals[i][0] - 1 if i < len(intervals) else end
+            piece = _clip_run(start, end, step, lo, hi)
+            if piece:
+                pieces.append(piece)
+            lo = hi + 1
+    pieces.sort()
+
+    result = list(intervals)
+    group = []
+    group_end = None
+    for piece in pieces + [None]:
+        if group and (piece is None or piece[0] > group_end):
+            result += _union_overlapping(group)
+            group = []
+        if piece is None:
+            break
+        if not group or piece[1] > group_end:
+            group_end = piece[1]
+        group.append(piece)
+    result.sort()
+    return result
+
+
+def _union_overlapping(runs):
+    """Merge stepped runs that lie in the same gap between intervals.
+
+    The span is cut wherever a run starts or ends, so every run that is
+    active in a segment runs right through it. In a segment the union
+    repeats with a period of the lcm of the steps, and if the residues
+    it covers form a single progression, the whole segment is one run.
+    e.g. odd and even frames make a step 1 run, and a run inside
+    another with a multiple of its step disappears. Otherwise the
+    segment is expanded into frames.
+    """
+    if len(runs) == 1:
+        return runs
+    if len(runs) > 64:
+        return _merged_runs(runs)
+    bounds = sorted(set([run[0] for run in runs] + [run[1] + 1 for run in runs]))
+    result = []
+    for lo, hi in zip(bounds, bounds[1:]):
+        active = []
+        for start, end, step in runs:
+            if start < hi and end >= lo:
+                piece = _clip_run(start, end, step, lo, hi - 1)
+                if piece:
+                    active.append((piece[0], piece[1], step))
+        result += _union_segment(active, lo, hi - 1)
+    return _coalesce_runs(result)
+
+
+def _union_segment(runs, lo, hi):
+    """Merge runs that all span the segment from lo to hi."""
+    if len(runs) < 2:
+        return [_normalize_run(*run) for run in runs]
+    period = 1
+    for _, _, step in runs:
+        period = period * step // math.gcd(period, step)
+    if sum(period // step for _, _, step in runs) <= hi - lo:
+        residues = set()
+        for start, _, step in runs:
+            residues.update(range((start - lo) % step, period, step))
+        residues = sorted(residues)
+        step, extra = divmod(period, len(residues))
+        if not extra and all(r % step == residues[0] for r in residues):
+            return [_clip_run(lo + residues[0], hi, step, lo, hi)]
+    return _merged_runs(runs)
+
+
+def _merged_runs(runs):
+    """Expand runs into frames and return the runs of their union."""
+    if _use_numpy(sum(_run_length(*run) for run in runs)):
+        return _runs_from_array(
+            _unique_array(
+                numpy.concatenate(
+                    [
+                        numpy.arange(start, end + 1, step, dtype=numpy.int64)
+                        for start, end, step in runs
+                    ]
+                )
+            )
+        )
+    return _runs_from_frames(
+        sorted(
+            set(
+                itertools.chain.from_iterable(
+                    range(start, end + 1, step) for start, end, step in runs
+                )
+            )
+        )
+    )
+
+
+def _intersect_run(run, other):
+    """Return the frames common to two runs as a run, or None.
+
+    The common frames solve two congruences, so by the Chinese
+    remainder theorem they form a progression whose step is the lcm of
+    the two steps.
+    """
+    start, end, step = run
+    other_start, other_end, other_step = other
+    lo = max(start, other_start)
+    hi = min(end, other_end)
+    if lo > hi:
+        return None
+    gcd = math.gcd(step, other_step)
+    if (other_start - start) % gcd:
+        return None
+    modulus = other_step // gcd
+    k = 0
+    if modulus > 1:
+        k = (other_start - start) // gcd * pow(step // gcd, -1, modulus) % modulus
+    return _clip_run(start + step * k, hi, step * modulus, lo, hi)
+
+
+def _intersect_runs(runs, others):
+    """Intersect two lists of sorted, non-interleaving runs."""
+    result = []
+    i = j = 0
+    while i < len(runs) and j < len(others):
+        common = _intersect_run(runs[i], others[j])
+        if common:
+            result.append(common)
+        if runs[i][1] < others[j][1]:
+            i += 1
+        else:
+            j += 1
+    return _coalesce_runs(result)
+
+
+def _runs_intersect(runs, others):
+    """Do two lists of sorted, non-interleaving runs share a frame."""
+    i = j = 0
+    while i < len(runs) and j < len(others):
+        if _intersect_run(runs[i], others[j]):
+            return True
+        if runs[i][1] < others[j][1]:
+            i += 1
+        else:
+            j += 1
+    return False
+
+
+def _difference_runs(runs, others):
+    """Remove the frames of one list of runs from another.
+
+    For each run, the frames to remove are its intersections with the
+    overlapping runs of the other list. A removed block of consecutive
+    frames costs one cut, and so does removing every other frame.
+    Removed frames spread out further leave a piece between each pair
+    of them.
+    """
+    result = []
+    j = 0
+    for start, end, step in runs:
+        while j < len(others) and others[j][1] < start:
+            j += 1
+        cursor = start
+        k = j
+        while k < len(others) and others[k][0] <= end:
+            common = _intersect_run((start, end, step), others[k])
+            k += 1
+            if not common:
+                continue
+            common_start, common_end, common_step = common
+            if common_step == step or common_start == common_end:
+                removed = [(common_start, common_end)]
+            elif common_step == 2 * step:
+                # Every other frame goes, the rest is one run.
+                if cursor < common_start:
+                    result.append(_normalize_run(cursor, common_start - step, step))
+                result.append(
+                    _normalize_run(common_start + step, common_end - step, common_step)
+                )
+                removed = []
+                cursor = common_end + step
+            else:
+                removed = (
+                    (frame, frame)
+                    for frame in range(common_start, common_end + 1, common_step)
+                )
+            for first, last in removed:
+                if cursor < first:
+                    result.append(_normalize_run(cursor, first - step, step))
+                cursor = last + step
+        if cursor <= end:
+            result.append(_normalize_run(cursor, end, step))
+    return _coalesce_runs(result)
+
+
+def _run_length(start, end, step):
+    """Return the number of frames in a run."""
+    return (end - start) // step + 1
+
+
+def _runs_from_frames(frames):
+    """Split sorted unique frames into runs of (start, end, step).
+
+    A run is extended while the gap to the next frame equals its step,
+    so runs never interleave: every frame in one run is less than every
+    frame in the next. A single frame run has a step of 1.
+    """
+    runs = []
+    start = end = step = None
+    for frame in frames:
+        if start is None:
+            start = end = frame
+        elif step is None:
+            step = frame - start
+            end = frame
+        elif frame - end == step:
+            end = frame
+        else:
+            runs.append((start, end, step))
+            start = end = frame
+            step = None
+    if start is not None:
+        runs.append((start, end, step or 1))
+    return runs
+
+
+def _sorted_unique_runs(frames):
+    """Return the runs of frames given in any order, maybe repeated."""
+    if numpy is not None and _backend != "python":
+        if not hasattr(frames, "__len__"):
+            frames = list(frames)
+        if _use_numpy(len(frames)):
+            values = numpy.asarray(frames)
+            # Unsigned 64 bit frames may not fit, so they go the slow way.
+            if values.ndim == 1 and values.dtype.kind in "iu":
+                if numpy.can_cast(values.dtype, numpy.int64):
+                    return _runs_from_array(
+                        _unique_array(values.astype(numpy.int64))
+                    )
+                frames = values.tolist()
+    return _runs_from_frames(sorted(set(frames)))
+
+
+def _unique_array(frames):
+    """Sort an int64 array and drop repeats.
+
+    Same result as numpy.unique(), which is much slower than a plain
+    sort for large int arrays in recent NumPy versions.
+    """
+    frames = numpy.sort(frames)
+    if len(frames) < 2:
+        return frames
+    keep = numpy.empty(len(frames), dtype=bool)
+    keep[0] = True
+    numpy.not_equal(frames[1:], frames[:-1], out=keep[1:])
+    return frames[keep]
+
+
+def _runs_from_array(frames):
+    """Vectorised _runs_from_frames() for a sorted unique NumPy array.
+
+    The gaps between frames are split into blocks of equal gaps. A
+    greedy run takes the gap after its first frame as its step, so it
+    ends where that gap's block ends. We loop over runs and blocks in
+    Python, but never over single frames.
+    """
+    count = len(frames)
+    if count < 3:
+        return _runs_from_frames(frames.tolist())
+    gaps = numpy.diff(frames)
+    block_ends = numpy.flatnonzero(numpy.diff(gaps)).tolist() + [len(gaps) - 1]
+    values = frames.tolist()
+    runs = []
+    pos = 0
+    block = 0
+    while pos < count:
+        if pos == count - 1:
+            runs.append((values[pos], values[pos], 1))
+            break
+        while block_ends[block] < pos:
+            block += 1
+        end = block_ends[block] + 1
+        runs.append((values[pos], values[end], values[pos + 1] - values[pos]))
+        pos = end + 1
+    return runs
+
+
+def _frames_at(frames, indices):
+    """Look up the frames at an int64 array of indices into storage."""
+    if isinstance(frames, _FrameView):
+        indices = frames.indices.start + indices * frames.indices.step
+        frames = frames.frames
+    if isinstance(frames, range):
+        return frames.start + indices * frames.step
+    offsets = numpy.asarray(frames._offsets, dtype=numpy.int64)
+    starts = numpy.asarray(frames._starts, dtype=numpy.int64)
+    steps = numpy.asarray(frames._steps, dtype=numpy.int64)
+    i = numpy.searchsorted(offsets, indices, side="right") - 1
+    return starts[i] + (indices - offsets[i]) * steps[i]
+
+
+def _indices_of(frames, values):
+    """Find an int64 array of frames in storage.
+
+    Returns an array of indices and a mask of the frames that were
+    found. Indices of missing frames are meaningless.
+    """
+    view = None
+    if isinstance(frames, _FrameView):
+        view = frames.indices
+        frames = frames.frames
+    if isinstance(frames, range):
+        offset = values - frames.start
+        found = (offset >= 0) & (values <= frames[-1]) & (offset % frames.step == 0)
+        indices = offset // frames.step
+    else:
+        offsets = numpy.asarray(frames._offsets, dtype=numpy.int64)
+        starts = numpy.asarray(frames._starts, dtype=numpy.int64)
+        ends = numpy.asarray(frames._ends, dtype=numpy.int64)
+        steps = numpy.asarray(frames._steps, dtype=numpy.int64)
+        i = numpy.searchsorted(starts, values, side="right") - 1
+        found = i >= 0
+        i = numpy.maximum(i, 0)
+        offset = values - starts[i]
+        found &= (values <= ends[i]) & (offset % steps[i] == 0)
+        indices = offsets[i] + offset // steps[i]
+    if view is not None:
+        offset = indices - view.start
+        found &= (offset >= 0) & (indices <= view[-1]) & (offset % view.step == 0)
+        indices = offset // view.step
+    return indices, found
+
+
+def _vectorised(frames):
+    """Can NumPy look up frames in this storage."""
+    if isinstance(frames, _FrameView):
+        frames = frames.frames
+    return not isinstance(frames, _FrameBitmap)
+
+
+def _take_runs(frames, indices):
+    """Return the runs of the frames at sorted unique indices into storage."""
+    if _use_numpy(len(indices)) and _vectorised(frames):
+        return _runs_from_array(
+            _frames_at(frames, numpy.asarray(indices, dtype=numpy.int64))
+        )
+    return _runs_from_frames([frames[index] for index in indices])
+
+
+def _coalesce_runs(runs):
+    """Join neighbouring runs that continue one another.
+
+    The input is any list of sorted, non-interleaving runs. The result
+    is exactly what _runs_from_frames() would produce for the same
+    frames, so a single resulting run means the frames form a
+    progression. Work is proportional to the number of runs.
+    """
+    return list(_iter_coalesced(runs))
+
+
+def _iter_coalesced(runs):
+    """Generate the runs of _coalesce_runs() one at a time."""
+    start = end = step = None
+    for run_start, run_end, run_step in runs:
+        while run_start <= run_end:
+            if start is None:
+                start = end = run_start
+            elif step is None:
+                step = run_start - start
+                end = run_start
+            elif run_start - end == step:
+                if run_step == step:
+                    end = run_end
+                    break
+                end = run_start
+            else:
+                yield (start, end, step)
+                start = end = run_start
+                step = None
+            run_start += run_step
+    if start is not None:
+        yield (start, end, step or 1)
+
+
+def _run_spec(start, end, step, range_sep="-", step_sep="x"):
+    """Return the spec token for a run, e.g. 1-10x2."""
+    if start == end:
+        return str(start)
+    if step == 1:
+        return "%s%s%s" % (start, range_sep, end)
+    return "%s%s%s%s%s" % (start, range_sep, end, step_sep, step)
+
+
+class _FrameRuns(object):
+    """Sorted unique frames stored as runs of (start, end, step).
+
+    Behaves like a read-only list of ints, but memory depends on the
+    number of runs rather than the number of frames. The run table is
+    kept in typed arrays of 64 bit ints, which take 8 bytes a value
+    rather than a boxed int each. Indexing and membership are binary
+    searches over the runs.
+    """
+
+    __slots__ = ("_starts", "_ends", "_steps", "_offsets", "_length")
+
+    def __init__(self, runs):
+        offsets = []
+        total = 0
+        for start, end, step in runs:
+            offsets.append(total)
+            total += _run_length(start, end, step)
+        self._starts = _int_array(run[0] for run in runs)
+        self._ends = _int_array(run[1] for run in runs)
+        self._steps = _int_array(run[2] for run in runs)
+        self._offsets = _int_array(offsets)
+        self._length = total
+
+    @property
+    def runs(self):
+        """The runs as a new list of (start, end, step) tuples."""
+        return list(self.iter_runs())
+
+    def iter_runs(self):
+        """Generate the runs straight from the run table."""
+        return zip(self._starts, self._ends, self._steps)
+
+    def iter_index_runs(self, indices):
+        """Generate runs for the frames at the given range of indices.
+
+        Each run contributes a sub-run with a multiplied step. When
+        fewer frames are picked than there are runs in between, the
+        frames are looked up by index instead, so the cost is the
+        smaller of the two.
+        """
+        if not indices:
+            return
+        first, last, stride = indices[0], indices[-1], indices.step
+        i = bisect.bisect_right(self._offsets, first) - 1
+        if len(indices) < bisect.bisect_right(self._offsets, last) - i:
+            for index in indices:
+                frame = self[index]
+                yield (frame, frame, 1)
+            return
+        while i < len(self._starts) and self._offsets[i] <= last:
+            start, end, step = self._starts[i], self._ends[i], self._steps[i]
+            offset = self._offsets[i]
+            if offset <= first:
+                lo = first - offset
+            else:
+                lo = (first - offset) % stride
+            hi = min(_run_length(start, end, step) - 1, last - offset)
+            if lo <= hi:
+                count = (hi - lo) // stride + 1
+                run_start = start + lo * step
+                run_end = run_start + (count - 1) * step * stride
+                yield (run_start, run_end, step * stride if count > 1 else 1)
+            i += 1
+
+    def _run_of(self, frame):
+        """Return the position of the run containing frame, or -1."""
+        i = bisect.bisect_right(self._starts, frame) - 1
+        if i >= 0:
+            offset = frame - self._starts[i]
+            if frame <= self._ends[i] and offset % self._steps[i] == 0:
+                return i
+        return -1
+
+    def index(self, frame):
+        """Return the index of a frame, or raise ValueError."""
+        i = self._run_of(frame)
+        if i < 0:
+            raise ValueError("%s is not in Sequence" % frame)
+        return self._offsets[i] + (frame - self._starts[i]) // self._steps[i]
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(
+            range(start, end + 1, step)
+            for start, end, step in zip(self._starts, self._ends, self._steps)
+        )
+
+    def __contains__(self, frame):
+        return self._run_of(frame) >= 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Sequence index out of range")
+        i = bisect.bisect_right(self._offsets, index) - 1
+        return self._starts[i] + (index - self._offsets[i]) * self._steps[i]
+
+
+class _FrameView(object):
+    """Frames at a range of indices into a _FrameRuns, without copying.
+
+    Chunks are views over their parent's storage, so making one costs
+    no more than finding out whether it is a progression. The runs are
+    only worked out when first needed, e.g. for a spec string, and are
+    then kept.
+    """
+
+    __slots__ = ("frames", "indices", "_runs")
+
+    def __init__(self, frames, indices):
+        self.frames = frames
+        self.indices = indices
+        self._runs = None
+
+    @property
+    def runs(self):
+        if self._runs is None:
+            self._runs = _coalesce_runs(self.frames.iter_index_runs(self.indices))
+        return self._runs
+
+    def iter_runs(self):
+        """Generate the runs, without keeping them if not already known."""
+        if self._runs is not None:
+            return iter(self._runs)
+        return _iter_coalesced(self.frames.iter_index_runs(self.indices))
+
+    def iter_index_runs(self, indices):
+        """Generate runs for the frames at the given range of indices."""
+        return self.frames.iter_index_runs(
+            self.indices[indices.start : indices.stop : indices.step]
+        )
+
+    def index(self, frame):
+        """Return the index of a frame, or raise ValueError."""
+        index = self.frames.index(frame)
+        if index not in self.indices:
+            raise ValueError("%s is not in Sequence" % frame)
+        return self.indices.index(index)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(
+            range(start, end + 1, step)
+            for start, end, step in self.frames.iter_index_runs(self.indices)
+        )
+
+    def __contains__(self, frame):
+        try:
+            self.index(frame)
+        except ValueError:
+            return False
+        return True
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.frames[self.indices[index]]
+
+
+# Frames in a bitmap are grouped into containers of 2**16 frames.
+# Containers with fewer than 4096 frames keep them as a sorted array of
+# 16 bit offsets. Fuller ones are 8KB bitmaps stored as bytes. They are
+# turned into ints for bitwise operations at C speed.
+_CONTAINER_BITS = 16
+_CONTAINER_MASK = (1 << _CONTAINER_BITS) - 1
+_CONTAINER_BYTES = 1 << (_CONTAINER_BITS - 3)
+_ARRAY_CONTAINER_LIMIT = 4096
+_RANK_BLOCK = 256
+
+
+def _iter_bits(data, start=0):
+    """Generate the positions of the set bits in bytes, from start."""
+    i = start >> 3
+    if i >= len(data):
+        return
+    byte = data[i] >> (start & 7) << (start & 7)
+    while True:
+        if byte:
+            base = i << 3
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+        i += 1
+        if i >= len(data):
+            return
+        byte = data[i]
+
+
+def _stepped_bits(count, step):
+    """Return an int with count bits set, step bits apart."""
+    bits = 1
+    have = 1
+    while have < count:
+        bits |= bits << (have * step)
+        have *= 2
+    return bits & ((1 << ((count - 1) * step + 1)) - 1)
+
+
+def _container_bits(container):
+    """Return a container as an int with a bit set for each frame."""
+    if isinstance(container, bytes):
+        return int.from_bytes(container, "little")
+    data = bytearray(_CONTAINER_BYTES)
+    for low in container:
+        data[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bytes(data), "little")
+
+
+def _make_container(bits):
+    """Return the container for an int of bits, or None if empty."""
+    if not bits:
+        return None
+    data = bits.to_bytes(_CONTAINER_BYTES, "little")
+    if _popcount(bits) < _ARRAY_CONTAINER_LIMIT:
+        return array.array("H", _iter_bits(data))
+    return data
+
+
+def _container_len(container):
+    if isinstance(container, bytes):
+        return _popcount(int.from_bytes(container, "little"))
+    return len(container)
+
+
+def _container_size(count):
+    """Estimate the bytes used by a container with count frames."""
+    return 64 + min(2 * count, _CONTAINER_BYTES)
+
+
+def _container_contains(container, low):
+    if isinstance(container, bytes):
+        return bool(container[low >> 3] >> (low & 7) & 1)
+    i = bisect.bisect_left(container, low)
+    return i < len(container) and container[i] == low
+
+
+def _block_ranks(data):
+    """Count the frames before each block of a bitmap container."""
+    ranks = array.array("I")
+    total = 0
+    for start in range(0, _CONTAINER_BYTES, _RANK_BLOCK):
+        ranks.append(total)
+        total += _popcount(int.from_bytes(data[start : start + _RANK_BLOCK], "little"))
+    return ranks
+
+
+def _container_rank(container, ranks, low):
+    """Return the number of frames less than low in a container.
+
+    ranks are the block counts of a bitmap. See _block_ranks().
+    """
+    if not isinstance(container, bytes):
+        return bisect.bisect_left(container, low)
+    i = low >> 3
+    block = i // _RANK_BLOCK
+    rank = ranks[block]
+    rank += _popcount(int.from_bytes(container[block * _RANK_BLOCK : i], "little"))
+    return rank + _popcount(container[i] & ((1 << (low & 7)) - 1))
+
+
+def _container_select(container, ranks, rank):
+    """Return the low of the frame with the given rank in a container.
+
+    For a bitmap, we find the block from its counts, then bisect on the
+    count of frames before each byte in the block.
+    """
+    if not isinstance(container, bytes):
+        return container[rank]
+    block = bisect.bisect_right(ranks, rank) - 1
+    rank -= ranks[block]
+    first = lo = block * _RANK_BLOCK
+    hi = lo + _RANK_BLOCK - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _popcount(int.from_bytes(container[first:mid], "little")) <= rank:
+            lo = mid
+        else:
+            hi = mid - 1
+    rank -= _popcount(int.from_bytes(container[first:lo], "little"))
+    return (lo << 3) + _BYTE_BITS[container[lo]][rank]
+
+
+def _container_iter(container, start=0):
+    """Generate the lows in a container, from the given low."""
+    if isinstance(container, bytes):
+        return _iter_bits(container, start)
+    return iter(container[bisect.bisect_left(container, start) :])
+
+
+def _container_intervals(container):
+    """Generate (first, last) lows of blocks of consecutive frames."""
+    if isinstance(container, bytes):
+        bits = int.from_bytes(container, "little")
+        firsts = (bits & ~(bits << 1)).to_bytes(_CONTAINER_BYTES, "little")
+        lasts = (bits & ~(bits >> 1)).to_bytes(_CONTAINER_BYTES, "little")
+        return zip(_iter_bits(firsts), _iter_bits(lasts))
+    return _array_intervals(container)
+
+
+def _array_intervals(lows):
+    first = last = None
+    for low in lows:
+        if first is None:
+            first = last = low
+        elif low == last + 1:
+            last = low
+        else:
+            yield (first, last)
+            first = last = low
+    if first is not None:
+        yield (first, last)
+
 
+def _bitmap_size(runs, limit):
+    """Estimate the bytes a bitmap of runs needs, or None if over limit.
 
-def _start_end_step(arr):
+    Runs do not interleave, so the containers strictly inside a run
+    only hold frames of that run. Only the containers at the ends of
+    runs need their frames counted.
     """
-    Return start, end, step if the array is a progression.
+    counts = collections.defaultdict(int)
+    size = 0
+    for start, end, step in runs:
+        first_key = start >> _CONTAINER_BITS
+        last_key = end >> _CONTAINER_BITS
+        if first_key == last_key:
+            counts[first_key] += _run_length(start, end, step)
+            continue
+        split = (first_key + 1) << _CONTAINER_BITS
+        counts[first_key] += _run_length(*_clip_run(start, end, step, start, split - 1))
+        piece = _clip_run(start, end, step, last_key << _CONTAINER_BITS, end)
+        if piece:
+            counts[last_key] += _run_length(*piece)
+        middle = last_key - first_key - 1
+        if middle:
+            size += middle * _container_size((1 << _CONTAINER_BITS) // step)
+            if size > limit:
+                return None
+    size += sum(_container_size(count) for count in counts.values())
+    if size > limit:
+        return None
+    return size
+
+
+class _FrameBitmap(object):
+    """Sorted unique frames stored in containers, as in Roaring bitmaps.
+
+    This storage suits dense frame sets that don't form runs, such as a
+    random half of a frame range. Each frame costs at most 2 bytes
+    rather than a run each. It behaves like _FrameRuns. Frames are
+    never expanded for membership, length, indexing or set operations
+    with another bitmap. Iteration and runs work a byte at a time, and
+    skip through blocks of consecutive frames.
     """
-    if len(arr) == 1:
-        return (arr[0], arr[0], 1)
-    elif len(arr) == 2:
-        return (arr[0], arr[1], arr[1] - arr[0])
-    elif list(range(arr[0], arr[-1] + 1, arr[2] - arr[1])) == arr:
-        return (arr[0], arr[-1], arr[1] - arr[0])
+
+    __slots__ = ("_keys", "_containers", "_ranks", "_offsets", "_length")
+
+    def __init__(self, keys, containers):
+        self._keys = _int_array(keys)
+        self._containers = containers
+        self._ranks = [
+            _block_ranks(c) if isinstance(c, bytes) else None for c in containers
+        ]
+        offsets = []
+        total = 0
+        for container in containers:
+            offsets.append(total)
+            total += _container_len(container)
+        self._offsets = _int_array(offsets)
+        self._length = total
+
+    @classmethod
+    def from_runs(cls, runs):
+        """Make a bitmap from sorted runs.
+
+        Short pieces of runs set bits in a byte array frame by frame.
+        Longer ones are made with shifts, a few at a time.
+        """
+        keys = []
+        containers = []
+        key = data = bits = None
+        for start, end, step in runs:
+            while start <= end:
+                run_key = start >> _CONTAINER_BITS
+                if run_key != key:
+                    if key is not None:
+                        bits |= int.from_bytes(bytes(data), "little")
+                        keys.append(key)
+                        containers.append(_make_container(bits))
+                    key = run_key
+                    data = bytearray(_CONTAINER_BYTES)
+                    bits = 0
+                base = key << _CONTAINER_BITS
+                count = (min(end, base + _CONTAINER_MASK) - start) // step + 1
+                low = start - base
+                if count > 64:
+                    bits |= _stepped_bits(count, step) << low
+                else:
+                    for low in range(low, low + count * step, step):
+                        data[low >> 3] |= 1 << (low & 7)
+                start += count * step
+        if key is not None:
+            bits |= int.from_bytes(bytes(data), "little")
+            keys.append(key)
+            containers.append(_make_container(bits))
+        return cls(keys, containers)
+
+    def _bits_by_key(self):
+        return dict(zip(self._keys, map(_container_bits, self._containers)))
+
+    def _combine(self, other, func, keys):
+        """Combine two bitmaps key by key with a bitwise function."""
+        mine = self._bits_by_key()
+        theirs = other._bits_by_key()
+        result_keys = []
+        containers = []
+        for key in keys(mine, theirs):
+            container = _make_container(func(mine.get(key, 0), theirs.get(key, 0)))
+            if container is not None:
+                result_keys.append(key)
+                containers.append(container)
+        return _FrameBitmap(result_keys, containers)
+
+    def intersection(self, other):
+        return self._combine(
+            other, lambda a, b: a & b, lambda a, b: sorted(set(a) & set(b))
+        )
+
+    def union(self, other):
+        return self._combine(
+            other, lambda a, b: a | b, lambda a, b: sorted(set(a) | set(b))
+        )
+
+    def difference(self, other):
+        return self._combine(other, lambda a, b: a & ~b, lambda a, b: sorted(a))
+
+    def intersects(self, other):
+        theirs = dict(zip(other._keys, other._containers))
+        for key, container in zip(self._keys, self._containers):
+            if key in theirs:
+                if _container_bits(container) & _container_bits(theirs[key]):
+                    return True
+        return False
+
+    def size(self):
+        """Estimate the bytes used by the containers."""
+        return sum(_container_size(_container_len(c)) for c in self._containers)
+
+    def iter_intervals(self):
+        """Generate runs of consecutive frames, not yet coalesced."""
+        for key, container in zip(self._keys, self._containers):
+            base = key << _CONTAINER_BITS
+            for first, last in _container_intervals(container):
+                yield (base + first, base + last, 1)
+
+    @property
+    def runs(self):
+        """The runs as a new list of (start, end, step) tuples."""
+        return _coalesce_runs(self.iter_intervals())
+
+    def iter_runs(self):
+        """Generate the runs one at a time."""
+        return _iter_coalesced(self.iter_intervals())
+
+    def _iter_from(self, index):
+        """Generate frames from the given index onwards."""
+        i = bisect.bisect_right(self._offsets, index) - 1
+        low = _container_select(
+            self._containers[i], self._ranks[i], index - self._offsets[i]
+        )
+        for key, container in zip(self._keys[i:], self._containers[i:]):
+            base = key << _CONTAINER_BITS
+            for low in _container_iter(container, low):
+                yield base + low
+            low = 0
+
+    def iter_index_runs(self, indices):
+        """Generate runs for the frames at the given range of indices."""
+        if not indices:
+            return
+        if indices.step == 1:
+            frames = itertools.islice(self._iter_from(indices[0]), len(indices))
+        else:
+            frames = (self[index] for index in indices)
+        for frame in frames:
+            yield (frame, frame, 1)
+
+    def _locate(self, frame):
+        """Return the position of the container for frame, and its low."""
+        key = frame >> _CONTAINER_BITS
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i, frame & _CONTAINER_MASK
+        return -1, None
+
+    def index(self, frame):
+        """Return the index of a frame, or raise ValueError."""
+        if frame not in self:
+            raise ValueError("%s is not in Sequence" % frame)
+        i, low = self._locate(frame)
+        return self._offsets[i] + _container_rank(
+            self._containers[i], self._ranks[i], low
+        )
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        if not self._length:
+            return iter(())
+        return self._iter_from(0)
+
+    def __contains__(self, frame):
+        i, low = self._locate(frame)
+        return i >= 0 and _container_contains(self._containers[i], low)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Sequence index out of range")
+        i = bisect.bisect_right(self._offsets, index) - 1
+        low = _container_select(
+            self._containers[i], self._ranks[i], index - self._offsets[i]
+        )
+        return (self._keys[i] << _CONTAINER_BITS) + low
+
+
+def _make_frames(runs):
+    """Return storage for sorted, coalesced runs.
+
+    Runs are compact unless nearly every frame starts a new one. A
+    bitmap is used when there are many runs and it would take less than
+    half the memory. The run table costs about 32 bytes a run.
+    """
+    if len(runs) >= BITMAP_MIN_RUNS:
+        if _bitmap_size(runs, 16 * len(runs)) is not None:
+            return _FrameBitmap.from_runs(runs)
+    return _FrameRuns(runs)
+
+
+class _ChunkPlan(object):
+    """Chunks cached on the Sequence that made them. See _ChunkPlanCache."""
+
+    __slots__ = ("chunks", "key", "__weakref__")
+
+    def __init__(self, chunks, key):
+        self.chunks = chunks
+        self.key = key
+
+
+class _ChunkPlanCache(object):
+    """Least recently used record of the chunk plans held by Sequences.
+
+    A plan lives on the Sequence that made it, so it goes away with the
+    Sequence, and the cache only holds a weak reference to it. The
+    total number of chunks in live plans is bounded, so a service
+    holding thousands of Sequences does not grow without bound. The
+    oldest plans are dropped from their Sequences to make room. A plan
+    bigger than the limit is not cached.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._plans = collections.OrderedDict()
+        self._size = 0
+        # Plans may die, and be forgotten, while the lock is held.
+        self._lock = threading.RLock()
+        self._keys = itertools.count()
+
+    def add(self, chunks):
+        """Return a plan for chunks to keep on a Sequence, or None."""
+        if len(chunks) > self.limit:
+            return None
+        plan = _ChunkPlan(chunks, next(self._keys))
+        ref = weakref.ref(plan, functools.partial(self._forget, plan.key))
+        with self._lock:
+            self._plans[plan.key] = (ref, len(chunks))
+            self._size += len(chunks)
+            while self._size > self.limit:
+                _, (old, size) = self._plans.popitem(last=False)
+                self._size -= size
+                old = old()
+                if old is not None:
+                    old.chunks = None
+        return plan
+
+    def touch(self, plan):
+        with self._lock:
+            if plan.key in self._plans:
+                self._plans.move_to_end(plan.key)
+
+    def _forget(self, key, ref=None):
+        with self._lock:
+            entry = self._plans.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            for ref, _ in list(self._plans.values()):
+                plan = ref()
+                if plan is not None:
+                    plan.chunks = None
+            self._plans.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._plans)
+
+
+_chunk_plans = _ChunkPlanCache(CHUNK_CACHE_LIMIT)
+
+
+def clear_chunk_cache():
+    """Drop all cached chunk plans."""
+    _chunk_plans.clear()
+
+
+class ChunkIndex(object):
+    """Find the chunks that frames belong to without making the chunks.
+
+    Chunk ids are positions in the list returned by chunks(). This is
+    useful to find the tasks that own failed frames.
+
+    The index is a snapshot of the chunk size and strategy of a
+    Sequence. For linear and cycle chunks, a frame's chunk follows from
+    its position in the Sequence. For the progression strategies, the
+    progressions are listed once. Those of 3 or more frames do not
+    interleave, so we bisect their starts. Shorter ones, i.e. paired
+    singles, are looked up by frame.
+    """
+
+    def __init__(self, sequence):
+        self.frames = sequence._iterable
+        self.chunk_size = sequence._chunk_size
+        self.strategy = sequence._chunk_strategy
+        if self.strategy == "cycle_progressions2":
+            self.strategy = "cycle_progressions"
+        elif self.strategy not in (
+            "cycle",
+            "progressions",
+            "cycle_progressions",
+            "balanced",
+            "balanced_lpt",
+        ):
+            self.strategy = "linear"
+        self.count = sequence.chunk_count()
+        self._plan = sequence._cached_chunks()
+
+        self._runs = []
+        self._starts = []
+        self._long = []
+        self._short = {}
+        self._bases = []
+        self._cycles = []
+        self._parts = []
+        self._owners = None
+        if self.strategy == "balanced":
+            self._parts = sequence._balanced_parts()
+            self._starts = [part.start for part in self._parts]
+        elif self.strategy == "balanced_lpt":
+            self._parts = sequence._balanced_parts()
+            self._owners = array.array("l", [0]) * len(self.frames)
+            for chunk_id, part in enumerate(self._parts):
+                for index in part:
+                    self._owners[index] = chunk_id
+        elif self.strategy == "progressions":
+            self._index_runs(_iter_progressions(sequence._runs(), self.chunk_size))
+        elif self.strategy == "cycle_progressions":
+            self._index_runs(sequence._progression_runs())
+            base = 0
+            for run in self._runs:
+                length = _run_length(*run)
+                cycles = int(math.ceil(length / float(min(self.chunk_size, length))))
+                self._bases.append(base)
+                self._cycles.append(cycles)
+                base += cycles
+
+    def _index_runs(self, runs):
+        for i, run in enumerate(runs):
+            self._runs.append(run)
+            if _run_length(*run) > 2:
+                self._starts.append(run[0])
+                self._long.append(i)
+            else:
+                self._short[run[0]] = i
+                self._short[run[1]] = i
+
+    def _run_of(self, frame):
+        """Return the position of the progression containing frame."""
+        i = self._short.get(frame)
+        if i is not None:
+            return i
+        k = bisect.bisect_right(self._starts, frame) - 1
+        if k >= 0:
+            i = self._long[k]
+            start, end, step = self._runs[i]
+            if frame <= end and (frame - start) % step == 0:
+                return i
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def chunk_of(self, frame):
+        """Return the id of the chunk containing frame, or None."""
+        return self._locate(frame)[0]
+
+    def chunks_of(self, frames):
+        """Return a list of chunk ids, one for each of the given frames.
+
+        Frames are usually reported many times, so each distinct frame
+        is located once. Frames not in the Sequence give None. For
+        linear and cycle chunks, many frames are located at once with
+        the NumPy backend.
+        """
+        if (
+            self.strategy in ("linear", "cycle")
+            and numpy is not None
+            and _vectorised(self.frames)
+        ):
+            if not hasattr(frames, "__len__"):
+                frames = list(frames)
+            values = None
+            if _use_numpy(len(frames)):
+                try:
+                    values = numpy.asarray(frames, dtype=numpy.int64)
+                except OverflowError:
+                    # Frames beyond 64 bits are looked up one by one.
+                    pass
+            if values is not None:
+                indices, found = _indices_of(self.frames, values)
+                if self.strategy == "cycle":
+                    ids = indices % self.count
+                else:
+                    ids = indices // self.chunk_size
+                return [
+                    chunk_id if ok else None
+                    for chunk_id, ok in zip(ids.tolist(), found.tolist())
+                ]
+        ids = {}
+        result = []
+        for frame in frames:
+            if frame not in ids:
+                ids[frame] = self._locate(frame)[0]
+            result.append(ids[frame])
+        return result
+
+    def _locate(self, frame):
+        """Return the chunk containing frame and the next frame that
+        could be in a different chunk.
+
+        The next frame is None if there are no more chunks to find.
+        Returns (None, None) if the frame is not in the Sequence.
+        """
+        if self.strategy in ("linear", "cycle"):
+            try:
+                index = self.frames.index(frame)
+            except ValueError:
+                return (None, None)
+            if self.strategy == "cycle":
+                return (index % self.count, frame + 1)
+            chunk_id = index // self.chunk_size
+            index = (chunk_id + 1) * self.chunk_size
+            if index >= len(self.frames):
+                return (chunk_id, None)
+            return (chunk_id, self.frames[index])
+
+        if self.strategy in ("balanced", "balanced_lpt"):
+            try:
+                index = self.frames.index(frame)
+            except ValueError:
+                return (None, None)
+            if self._owners is not None:
+                return (self._owners[index], frame + 1)
+            chunk_id = bisect.bisect_right(self._starts, index) - 1
+            index = self._parts[chunk_id].stop
+            if index >= len(self.frames):
+                return (chunk_id, None)
+            return (chunk_id, self.frames[index])
+
+        i = self._run_of(frame)
+        if i is None:
+            return (None, None)
+        start, end, step = self._runs[i]
+        if self.strategy == "progressions":
+            if _run_length(start, end, step) > 2:
+                return (i, end + 1)
+            return (i, frame + 1)
+        return (self._bases[i] + (frame - start) // step % self._cycles[i], frame + 1)
+
+    def frames_of(self, chunk_id):
+        """Return the chunk with the given id, as made by chunks().
+
+        Raises IndexError if there is no such chunk.
+        """
+        if chunk_id < 0:
+            chunk_id += self.count
+        if not 0 <= chunk_id < self.count:
+            raise IndexError("Chunk id out of range")
+        if self._plan is not None:
+            return self._plan[chunk_id]._copy()
+        num = len(self.frames)
+        if self.strategy == "linear":
+            start = chunk_id * self.chunk_size
+            return Sequence._view(
+                self.frames, range(start, min(start + self.chunk_size, num))
+            )
+        if self.strategy == "cycle":
+            return Sequence._view(self.frames, range(chunk_id, num, self.count))
+        if self.strategy == "progressions":
+            return Sequence._progression(*self._runs[chunk_id])
+        if self.strategy == "balanced":
+            return Sequence._view(self.frames, self._parts[chunk_id])
+        if self.strategy == "balanced_lpt":
+            return Sequence._from_runs(_take_runs(self.frames, self._parts[chunk_id]))
+        i = bisect.bisect_right(self._bases, chunk_id) - 1
+        start, end, step = self._runs[i]
+        frames = range(start, end + 1, step)
+        return Sequence._view(
+            frames, range(chunk_id - self._bases[i], len(frames), self._cycles[i])
+        )
 
 
 class Sequence(object):
@@ -106,13 +2204,26 @@ class Sequence(object):
     # __magic_shield forces the user to use the factory method: create()
     __magic_shield = object()
 
+    # Jobs can hold many thousands of chunks, so there's no __dict__.
+    __slots__ = (
+        "_iterable",
+        "_chunk_size",
+        "_chunk_strategy",
+        "_chunk_costs",
+        "_plan",
+        "_progressions",
+        "_spec",
+    )
+
     @staticmethod
     def permutations(template, **kw):
-        for vals in itertools.product(
-            *(iter(Sequence.create(spec)) for spec in kw.values())
-        ):
-            subs = dict(zip(kw, vals))
-            yield template % subs
+        """Return the filenames for all combinations of values of the keywords.
+
+        Each keyword is a spec or Sequence, and is a mapping key in the
+        template. The result is a Permutations object, which is lazy,
+        and can be indexed and split into shards.
+        """
+        return Permutations(template, **kw)
 
     @classmethod
     def create(cls, *args, **kw):
@@ -123,17 +2234,73 @@ class Sequence(object):
         expressed as an arithmetic progression: i.e. start, end, step.
         """
 
-        frames = _resolve_frames(*args, **kw)
-        if not frames:
+        runs = _resolve_runs(*args, **kw)
+        if not runs:
             raise TypeError("Can't create Sequence with no frames")
 
-        progression_spec = _start_end_step(frames)
-        if progression_spec:
-            return Progression(cls.__magic_shield, *progression_spec, **kw)
+        # A single run, e.g. from a range or a one token spec, becomes a
+        # lazy Progression without looking at any frames.
+        if len(runs) == 1:
+            return cls._progression(*runs[0], **kw)
+        return cls._from_runs(runs, **kw)
+
+    @classmethod
+    def _view(cls, frames, indices, **kw):
+        """Create a chunk from a range of indices into existing storage.
+
+        Nothing is validated or copied. The chunk is a Progression if
+        its frames are, which we find out by coalescing runs only until
+        a second run shows up.
+        """
+        if isinstance(frames, range):
+            part = frames[indices.start : indices.stop : indices.step]
+            return cls._progression(
+                part[0], part[-1], part.step if len(part) > 1 else 1, **kw
+            )
+        if isinstance(frames, _FrameView):
+            indices = frames.indices[indices.start : indices.stop : indices.step]
+            frames = frames.frames
+        runs = list(itertools.islice(_iter_coalesced(frames.iter_index_runs(indices)), 2))
+        if len(runs) == 1:
+            return cls._progression(*runs[0], **kw)
+        return Sequence(cls.__magic_shield, _FrameView(frames, indices), **kw)
+
+    @classmethod
+    def _progression(cls, start, end, step, **kw):
+        """Create a Progression from a run that is known to be valid."""
+        return Progression(cls.__magic_shield, start, end, step, **kw)
+
+    @classmethod
+    def _from_runs(cls, runs, **kw):
+        """Create a Sequence or Progression from sorted runs.
+
+        The runs must be sorted and non-interleaving, which is the case
+        for anything derived from an existing Sequence, so no further
+        validation is done.
+        """
+        runs = _coalesce_runs(runs)
+        if len(runs) == 1:
+            return cls._progression(*runs[0], **kw)
+        return Sequence(cls.__magic_shield, _make_frames(runs), **kw)
+
+    @classmethod
+    def _from_bitmap(cls, frames, **kw):
+        """Create a Sequence or Progression from a bitmap, or None if empty.
+
+        The bitmap is kept if the frames make enough runs for it to be
+        worth it. See _make_frames(). Runs are only counted up to that
+        point.
+        """
+        if not frames:
+            return None
+        limit = max(BITMAP_MIN_RUNS, frames.size() // 16 + 1)
+        runs = list(itertools.islice(_iter_coalesced(frames.iter_intervals()), limit))
+        if len(runs) < limit:
+            return cls._from_runs(runs, **kw)
         return Sequence(cls.__magic_shield, frames, **kw)
 
     def __init__(self, _shield, iterable, **kw):
-        """Instantiate from list of ints.
+        """Instantiate from frame storage.
 
         This method will usually be called by a factory. chunk size
         defaults to the length of the sequence if missing or if -1 is
@@ -150,6 +2317,11 @@ class Sequence(object):
         self._chunk_size = num if chunk_size < 1 else sorted([num, chunk_size])[0]
 
         self._chunk_strategy = kw.get("chunk_strategy", "linear")
+        self.chunk_costs = kw.get("chunk_costs")
+
+        # Frames never change, so the spec is computed at most once.
+        self._progressions = None
+        self._spec = None
 
     @property
     def start(self):
@@ -166,6 +2338,21 @@ class Sequence(object):
         """return the length."""
         return len(self._iterable)
 
+    def _runs(self):
+        """return the frames as a list of (start, end, step) runs."""
+        return self._iterable.runs
+
+    def _progression_runs(self):
+        """return the greedy progressions as runs, as used by str().
+
+        The list is cached, since the frames of a Sequence never change.
+        """
+        if self._progressions is None:
+            self._progressions = list(
+                _pair_singles(_greedy_progressions(self._runs(), len(self)))
+            )
+        return self._progressions
+
     def _cycle_chunks(self):
         """Generate chunks with frame cycling.
 
@@ -177,11 +2364,9 @@ class Sequence(object):
         for a whole chunk to render on one machine.
         """
         num_chunks = self.chunk_count()
-        result = [[] for i in range(num_chunks)]
-        for index, frame in enumerate(self._iterable):
-            idx = index % num_chunks
-            result[idx].append(frame)
-        return [Sequence.create(x) for x in result]
+        num = len(self._iterable)
+        for i in range(num_chunks):
+            yield Sequence._view(self._iterable, range(i, num, num_chunks))
 
     def _cycle_progression_chunks(self):
         """
@@ -193,24 +2378,50 @@ class Sequence(object):
         progression, set the chunk size to our own chunk size, then emit cycle
         chunks.
         """
-        chunks = Progression.factory(self._iterable, max_size=-1)
-
-        result = []
-        for chunk in chunks:
-            chunk.chunk_size = self.chunk_size
-            chunk.chunk_strategy = "cycle"
-            result += chunk.chunks()
-        return result
-
+        for run in self._progression_runs():
+            chunk = Sequence._progression(
+                *run, chunk_size=self.chunk_size, chunk_strategy="cycle"
+            )
+            for sub in chunk.iter_chunks():
+                yield sub
+
+    def _progression_chunks(self):
+        """Generate progressions no longer than chunk size. See Progression.factory()"""
+        for run in _iter_progressions(self._runs(), self._chunk_size):
+            yield Sequence._progression(*run)
+
+    def _balanced_parts(self):
+        """Return the index ranges or lists of the balanced strategies."""
+        costs = self._chunk_costs or {}
+        # Runs are only needed to match costs given for specs and ranges.
+        runs = self._runs() if costs else []
+        weights = _chunk_weights(self._iterable, runs, costs)
+        count = self._count_chunks(self._chunk_size)
+        if self._chunk_strategy == "balanced_lpt":
+            return _lpt_partition(weights, count)
+        bounds = _linear_partition(weights, count)
+        return [range(start, end) for start, end in zip(bounds, bounds[1:])]
+
+    def _balanced_chunks(self):
+        """Generate chunks of about equal cost. See _balanced_parts()."""
+        parts = self._balanced_parts()
+        if self._chunk_strategy == "balanced_lpt":
+            frames = list(self._iterable)
+            for part in parts:
+                yield Sequence._from_runs(
+                    _runs_from_frames([frames[index] for index in part])
+                )
+            return
+        for part in parts:
+            yield Sequence._view(self._iterable, part)
 
     def _linear_chunks(self):
         """Generate chunks in sorted order."""
-        result = []
-        for i in range(0, len(self._iterable), self._chunk_size):
-            result.append(
-                Sequence.create(list(self._iterable)[i : i + self._chunk_size])
+        num = len(self._iterable)
+        for i in range(0, num, self._chunk_size):
+            yield Sequence._view(
+                self._iterable, range(i, min(i + self._chunk_size, num))
             )
-        return result
 
     def chunks(self):
         """return list of chunks according to size and chunk strategy.
@@ -235,7 +2446,86 @@ class Sequence(object):
         "cycle_progressions" makes cycles as described above but
         with the constraint that each Sequence is a Progression.
 
+        "balanced" makes as many chunks as linear, but of frames of
+        about equal total cost rather than equal count. Costs are
+        given with chunk_costs. The chunks are contiguous, and the
+        largest chunk cost is as small as it can be. See
+        _linear_partition().
+
+        "balanced_lpt" does the same without keeping chunks
+        contiguous, which can balance costs better. Each frame, from
+        the most costly, goes to the cheapest chunk so far.
+
+        The plan is cached for the current chunk size and strategy.
+        Repeated calls return new copies of the cached chunks, so they
+        may be changed freely.
+        """
+        plan = self._cached_chunks()
+        if plan is None:
+            plan = tuple(self._generate_chunks())
+            self._plan = _chunk_plans.add(plan)
+        return [chunk._copy() for chunk in plan]
+
+    def iter_chunks(self):
+        """Generate the same chunks as chunks(), one at a time.
+
+        Chunks are made on demand, so memory stays bounded by the size
+        of a chunk rather than the whole plan. This is useful to stream
+        tasks as they are made. A cached plan is used if there is one,
+        but a generated plan is not cached.
+        """
+        plan = self._cached_chunks()
+        if plan is not None:
+            return (chunk._copy() for chunk in plan)
+        return self._generate_chunks()
+
+    def _cached_chunks(self):
+        """Return the cached chunks for the current settings, or None.
+
+        The plan is dropped whenever settings change, and is never
+        pickled or copied. See __getstate__().
         """
+        plan = self._plan
+        if plan is None or plan.chunks is None:
+            return None
+        _chunk_plans.touch(plan)
+        return plan.chunks
+
+    def _invalidate_chunks(self):
+        """Forget the cached chunk plan."""
+        self._plan = None
+
+    def _copy(self):
+        """Return a shallow copy that does not share cached chunk plans.
+
+        Cached chunks are copied before they are handed out, so changes
+        to a chunk's settings don't leak into later calls.
+        """
+        other = object.__new__(type(self))
+        other.__setstate__(self._slot_values())
+        return other
+
+    def _slot_values(self):
+        return dict(
+            (name, getattr(self, name))
+            for name in Sequence.__slots__
+            if name != "_plan" and hasattr(self, name)
+        )
+
+    def __getstate__(self):
+        # A chunk that views its parent's storage gets its own, so the
+        # parent is not pickled with it.
+        state = self._slot_values()
+        if isinstance(self._iterable, _FrameView):
+            state["_iterable"] = _make_frames(self._runs())
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._plan = None
+
+    def _generate_chunks(self):
         if self._chunk_strategy == "cycle":
             return self._cycle_chunks()
         if self._chunk_strategy == "cycle_progressions":
@@ -243,50 +2533,176 @@ class Sequence(object):
         if self._chunk_strategy == "cycle_progressions2":
             return self._cycle_progression_chunks()
         if self._chunk_strategy == "progressions":
-            return Progression.factory(self._iterable, max_size=self._chunk_size)
+            return self._progression_chunks()
+        if self._chunk_strategy in ("balanced", "balanced_lpt"):
+            return self._balanced_chunks()
         return self._linear_chunks()
 
     def chunk_count(self):
         """Calculate the number of chunks that will be emitted.
 
-        If strategy is progressions we just generate them and count the
-        objects. Otherwise we can calculate from the frame length and
-        chunk size directly
+        No chunks are made. For linear and cycle strategies we calculate
+        from the frame length and chunk size directly. For progressions
+        we run the greedy splitter over the runs and only count what it
+        finds. For cycle_progressions we add up the cycle chunks of each
+        cached progression.
         """
+        plan = self._cached_chunks()
+        if plan is not None:
+            return len(plan)
+        return self._count_chunks(self._chunk_size)
+
+    def _count_chunks(self, chunk_size):
+        """Calculate the number of chunks for the given chunk size."""
+        num = len(self._iterable)
         if self._chunk_strategy == "progressions":
-            return len(Progression.factory(self._iterable, max_size=self._chunk_size))
-        return int(math.ceil(len(self._iterable) / float(self._chunk_size)))
+            return _count_progressions(self._runs(), chunk_size)
+        if self._chunk_strategy in ("cycle_progressions", "cycle_progressions2"):
+            count = 0
+            for start, end, step in self._progression_runs():
+                length = _run_length(start, end, step)
+                count += int(math.ceil(length / float(min(chunk_size, length))))
+            return count
+        return int(math.ceil(num / float(chunk_size)))
 
     def cap_chunk_count(self, max_count):
         """Cap the number of chunks to a max value.
 
         This is useful for limiting the number of chunks to a reasonable
         number, e.g. for a render farm.
-        """
-        if self.chunk_count() > max_count:
-            self.chunk_size = int(math.ceil(len(self._iterable) / float(max_count)))
 
+        For the progression strategies, the count also depends on where
+        progressions break. The unlimited progressions are found once,
+        which gives the fewest chunks there can be. If that is still too
+        many, chunk size is set to the length. Otherwise the lengths of
+        those progressions give the count for any chunk size without
+        looking at frames again. See _cap_progressions().
+        """
+        if self.chunk_count() <= max_count:
+            return
+        self._invalidate_chunks()
+        num = len(self._iterable)
+        size = int(math.ceil(num / float(max_count)))
+        if self._chunk_strategy in ("cycle_progressions", "cycle_progressions2"):
+            lengths = collections.Counter(
+                _run_length(*run) for run in self._progression_runs()
+            )
+            size = _smallest_chunk_size(lengths, 0, size, max(lengths), max_count)
+            if size is None:
+                size = num
+        elif self._chunk_strategy == "progressions":
+            size = self._cap_progressions(size, max_count)
+        self.chunk_size = size
+
+    def _cap_progressions(self, low, max_count):
+        """Return the chunk size that caps the progressions strategy.
+
+        Cutting the unlimited progressions into pieces no longer than
+        the chunk size estimates the count. The estimate is usually
+        exact or a size or two too cautious, so the size it gives is
+        checked with the greedy count and walked down while smaller
+        sizes still fit. The full search only runs if the check fails.
+        """
+        runs = self._runs()
+        num = len(self._iterable)
+        lengths = collections.Counter()
+        singles = 0
+        for start, end, step in _greedy_progressions(runs, num):
+            if start == end:
+                singles += 1
+            else:
+                lengths[_run_length(start, end, step)] += 1
+        if sum(lengths.values()) + (singles + 1) // 2 > max_count:
+            return num
+
+        # No progression is cut at the longest length, so it fits.
+        high = max([low, 2] + list(lengths))
+        size = _smallest_chunk_size(lengths, singles, low, high, max_count)
+        if _count_progressions(runs, size) > max_count:
+            low = size + 1
+            while low < high:
+                mid = (low + high) // 2
+                if _count_progressions(runs, mid) <= max_count:
+                    high = mid
+                else:
+                    low = mid + 1
+            return low
+        while size > low and _count_progressions(runs, size - 1) <= max_count:
+            size -= 1
+        return size
+
+    def _bitmaps(self, iterable, runs, clip=True):
+        """Return our frames and those of iterable as two bitmaps.
+
+        runs are the runs of iterable from _operand_runs(), or None if
+        it is in a bitmap. Returns None unless one side is already in a
+        bitmap. The other side is made into a bitmap too, unless it
+        would be much bigger. With clip, the frames of iterable are
+        clipped to our span first, which is all that matters for
+        intersections and differences.
+        """
+        mine = theirs = None
+        if isinstance(self._iterable, _FrameBitmap):
+            mine = self._iterable
+        if runs is None:
+            theirs = iterable._iterable
+        if mine is None and theirs is None:
+            return None
+        if theirs is None:
+            if clip:
+                runs = [_clip_run(*run, self.start, self.end) for run in runs]
+                runs = [run for run in runs if run]
+            if _bitmap_size(runs, 2 * mine.size()) is None:
+                return None
+            theirs = _FrameBitmap.from_runs(runs)
+        elif mine is None:
+            runs = self._runs()
+            if _bitmap_size(runs, 2 * theirs.size()) is None:
+                return None
+            mine = _FrameBitmap.from_runs(runs)
+        return mine, theirs
 
     def intersection(self, iterable):
         """Generate a Sequence that is the intersection of an iterable with
         this Sequence.
 
         This is useful for determining which scout frames are valid
+
+        Both sides are merged as sorted runs, so the cost depends on the
+        number of runs, not the number of frames. If either side is in a
+        bitmap, bitmaps are combined instead. See _bitmaps().
         """
-        common_frames = set(self._iterable).intersection(set(iterable))
-        if not common_frames:
+        runs = _operand_runs(iterable)
+        bitmaps = self._bitmaps(iterable, runs)
+        if bitmaps is not None:
+            return Sequence._from_bitmap(
+                bitmaps[0].intersection(bitmaps[1]),
+                chunk_size=self._chunk_size,
+                chunk_strategy=self._chunk_strategy,
+                chunk_costs=self._chunk_costs,
+            )
+        if runs is None:
+            runs = iterable._runs()
+        common_runs = _intersect_runs(self._runs(), runs)
+        if not common_runs:
             return None
-        return Sequence.create(
-            common_frames,
+        return Sequence._from_runs(
+            common_runs,
             chunk_size=self._chunk_size,
             chunk_strategy=self._chunk_strategy,
+            chunk_costs=self._chunk_costs,
         )
 
-
     def intersects(self, iterable):
         """Determine if an iterable intersects this Sequence"""
-        return len(set(self._iterable).intersection(set(iterable))) > 0  
- 
+        runs = _operand_runs(iterable)
+        bitmaps = self._bitmaps(iterable, runs)
+        if bitmaps is not None:
+            return bitmaps[0].intersects(bitmaps[1])
+        if runs is None:
+            runs = iterable._runs()
+        return _runs_intersect(self._runs(), runs)
+
     def union(self, iterable):
         """Generate a Sequence that is the union of an iterable with this
         Sequence.
@@ -294,29 +2710,94 @@ class Sequence(object):
         Useful for getting a sequence that covers multiple
         output ranges.
         """
-        union_frames = set(self._iterable).union(set(iterable))
+        runs = _operand_runs(iterable)
+        bitmaps = self._bitmaps(iterable, runs, clip=False)
+        if bitmaps is not None:
+            return Sequence._from_bitmap(
+                bitmaps[0].union(bitmaps[1]),
+                chunk_size=self._chunk_size,
+                chunk_strategy=self._chunk_strategy,
+                chunk_costs=self._chunk_costs,
+            )
+        if runs is None:
+            runs = iterable._runs()
+        union_runs = _union_runs(self._runs() + runs)
 
-        return Sequence.create(
-            union_frames,
+        return Sequence._from_runs(
+            union_runs,
             chunk_size=self._chunk_size,
             chunk_strategy=self._chunk_strategy,
+            chunk_costs=self._chunk_costs,
         )
 
     def difference(self, iterable):
         """Generate a Sequence that is the difference of an iterable with this
         Sequence.
         """
-        diff_frames = set(self._iterable).difference(set(iterable))
-        if not diff_frames:
+        runs = _operand_runs(iterable)
+        bitmaps = self._bitmaps(iterable, runs)
+        if bitmaps is not None:
+            return Sequence._from_bitmap(
+                bitmaps[0].difference(bitmaps[1]),
+                chunk_size=self._chunk_size,
+                chunk_strategy=self._chunk_strategy,
+                chunk_costs=self._chunk_costs,
+            )
+        if runs is None:
+            runs = iterable._runs()
+        diff_runs = _difference_runs(self._runs(), runs)
+        if not diff_runs:
             return None
-        return Sequence.create(
-            diff_frames,
+        return Sequence._from_runs(
+            diff_runs,
             chunk_size=self._chunk_size,
             chunk_strategy=self._chunk_strategy,
+            chunk_costs=self._chunk_costs,
         )
 
-    
-    
+    @classmethod
+    def union_all(cls, iterables, **kw):
+        """Generate a Sequence that is the union of many iterables.
+
+        The sorted runs of all the iterables are merged with a heap and
+        combined in a single pass. The runs of Sequences are read from
+        their storage as the merge needs them, so for those, memory
+        grows with the runs of the result rather than the runs of the
+        inputs. Other items, which can be anything Sequence.create()
+        accepts, are resolved to runs first.
+
+        Returns None if there are no frames.
+        """
+        union_runs = list(
+            _iter_union(
+                heapq.merge(*[_iter_runs_of(iterable) for iterable in iterables])
+            )
+        )
+        if not union_runs:
+            return None
+        return cls._from_runs(union_runs, **kw)
+
+    @classmethod
+    def intersection_all(cls, iterables, **kw):
+        """Generate a Sequence of the frames common to many iterables.
+
+        The common runs so far are merged with each iterable in turn,
+        and can only shrink, so we stop as soon as there are none.
+
+        Returns None if there are no common frames.
+        """
+        common_runs = None
+        for iterable in iterables:
+            runs = _runs_of(iterable)
+            if common_runs is None:
+                common_runs = runs
+            else:
+                common_runs = _intersect_runs(common_runs, runs)
+            if not common_runs:
+                return None
+        if common_runs is None:
+            return None
+        return cls._from_runs(common_runs, **kw)
 
     def offset(self, value):
         """Generate a new Sequence with all values offset.
@@ -324,48 +2805,60 @@ class Sequence(object):
         It is an error if the new sequence would contain negative
         numbers.
         """
-        offset_frames = [x + value for x in self._iterable]
-        return Sequence.create(
-            offset_frames,
+        offset_runs = [
+            (start + value, end + value, step) for start, end, step in self._runs()
+        ]
+        return Sequence._from_runs(
+            offset_runs,
             chunk_size=self._chunk_size,
             chunk_strategy=self._chunk_strategy,
         )
 
     def intersecting_chunks(self, iterable):
-        """Return chunks that intersect the given sequence."""
-        result = []
-        for c in self.chunks():
-            if c.intersects(iterable):
-                result.append(c)
-        return result
+        """Return chunks that intersect the given sequence.
 
+        Only the frames in common are looked at. Each one finds its
+        chunk through a chunk index, then we skip to the first frame
+        that could be in another chunk. No other chunks are made. If
+        either side is in a bitmap, the frames in common come from
+        combining bitmaps, so our runs are never listed. See _bitmaps().
+        """
+        index = ChunkIndex(self)
+        found = set()
+        runs = _operand_runs(iterable)
+        bitmaps = self._bitmaps(iterable, runs)
+        if bitmaps is not None:
+            common_runs = bitmaps[0].intersection(bitmaps[1]).iter_intervals()
+        else:
+            if runs is None:
+                runs = iterable._runs()
+            common_runs = _intersect_runs(self._runs(), runs)
+        for start, end, step in common_runs:
+            frame = start
+            while frame <= end and len(found) < index.count:
+                chunk_id, next_frame = index._locate(frame)
+                found.add(chunk_id)
+                if next_frame is None:
+                    break
+                frame = max(frame + step, start - (start - next_frame) // step * step)
+        return [index.frames_of(chunk_id) for chunk_id in sorted(found)]
 
     def expand(self, template):
         """Expand a hash template with this sequence.
 
         Example /some/directory_###/image.#####.exr. Sequence is invalid
-        if it contains no hashes. First we replace the hashes with a
-        template placeholder that specifies the padding as a number.
-        Then we use format to replace the placehoders with numbers.
+        if it contains no hashes. The template is compiled once to a
+        format string with a field padded to the length of each group of
+        hashes. See compile_template().
         """
-        if not re.compile("#+").search(template):
-            raise ValueError("Template must contain hashes.")
-
-        format_template = re.sub(
-            r"(#+)", lambda match: "{{0:0{:d}d}}".format(len(match.group(1))), template
-        )
-
-        return [format_template.format(el) for el in self._iterable]
+        return compile_template(template).expand(self._iterable)
 
     def expand_format(self, *templates):
         """
         cycle the templates until there are as many as there are frames
         in the sequence. Then replace with the frame
         """
-        result = []
-        for f, template in zip(self._iterable, itertools.cycle(templates)):
-            result.append(template.format(frame=f))
-        return result
+        return list(self._iter_templates(templates, "format"))
 
     def expand_dollar_f(self, *templates):
         """
@@ -401,16 +2894,97 @@ class Sequence(object):
         Use case - A filename contains 2 different types of token.
 
         """
-        result = []
-        for f, template in zip(self._iterable, itertools.cycle(templates)):
-            format_template = re.sub(
-                r"\$(\d?)F(\d?)",
-                lambda match: "{{frame:0{:d}d}}".format(int(match.group(2) or match.group(1) or 0)),
-                template,
-                flags=re.IGNORECASE
+        return list(self._iter_templates(templates, "dollar"))
+
+    def iter_expand(self, template):
+        """Generate the filenames of expand() one at a time."""
+        return map(compile_template(template).format, self._iterable)
+
+    def iter_expand_format(self, *templates):
+        """Generate the filenames of expand_format() one at a time."""
+        return self._iter_templates(templates, "format")
+
+    def iter_expand_dollar_f(self, *templates):
+        """Generate the filenames of expand_dollar_f() one at a time."""
+        return self._iter_templates(templates, "dollar")
+
+    def _iter_templates(self, templates, style):
+        """Format each frame with the next of the templates, cycling."""
+        formats = [compile_template(template, style).format for template in templates]
+        if len(formats) == 1:
+            return map(formats[0], self._iterable)
+        return (
+            format(frame)
+            for frame, format in zip(self._iterable, itertools.cycle(formats))
+        )
+
+    def expand_to(self, stream, template, style="hash", block_size=EXPAND_BLOCK_SIZE):
+        """Write the filenames of a template to a file object, one per line.
+
+        Filenames are written in blocks of block_size, so memory use
+        does not grow with the number of frames. style is "hash",
+        "dollar" or "format", as for expand(), expand_dollar_f() and
+        expand_format(). Returns the number of filenames written.
+        """
+        template = compile_template(template, style)
+        frames = iter(self._iterable)
+        count = 0
+        while True:
+            block = list(itertools.islice(frames, block_size))
+            if not block:
+                return count
+            stream.write(template.lines(block))
+            count += len(block)
+
+    def present_on_disk(self, template, min_size=None, max_workers=8):
+        """Return the frames whose files exist, or None if there are none.
+
+        template is a hash template, as given to expand(). Rather than
+        checking each path, each directory is listed once, in a pool of
+        threads, and the frames are read from the names in it. If the
+        template's directory has no hashes, no paths are made at all.
+
+        With min_size, files smaller than min_size bytes don't count.
+        That needs a stat for each file that exists.
+        """
+        template = compile_template(template)
+        directory, base = os.path.split(template.template)
+        if "#" in directory:
+            groups = collections.defaultdict(list)
+            directory = compile_template(directory)
+            for frame in self._iterable:
+                groups[directory.format(frame)].append(frame)
+        else:
+            groups = {directory: self}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            found = pool.map(
+                _present_in, groups, groups.values(), itertools.repeat(base)
             )
-            result.append(format_template.format(frame=f))
-        return result
+            present = self.intersection(list(itertools.chain.from_iterable(found)))
+            if present is None or min_size is None:
+                return present
+
+            frames = list(present)
+            paths = template.expand(frames)
+            batches = [
+                paths[i : i + _STAT_BATCH] for i in range(0, len(paths), _STAT_BATCH)
+            ]
+            flags = itertools.chain.from_iterable(
+                pool.map(_big_enough, batches, itertools.repeat(min_size))
+            )
+            frames = [frame for frame, flag in zip(frames, flags) if flag]
+        if not frames:
+            return None
+        return self.intersection(frames)
+
+    def missing_on_disk(self, template, min_size=None, max_workers=8):
+        """Return the frames whose files don't exist, or None if there are none.
+
+        See present_on_disk().
+        """
+        present = self.present_on_disk(template, min_size, max_workers)
+        return self.difference(present or [])
 
     def subsample(self, count):
         """Take a selection of elements from the sequence.
@@ -421,42 +2995,43 @@ class Sequence(object):
         n = len(self)
         count = _clamp(1, count, n)
 
-        res = []
         gap = n / float(count)
-        pos = gap / 2.0
-
-        for _ in range(count):
-            index = int(pos)
-            res.append(self._iterable[index])
-            pos += gap
+        if _use_numpy(count):
+            # cumsum adds in order, so positions match the loop below.
+            positions = numpy.full(count, gap)
+            positions[0] = gap / 2.0
+            indices = numpy.cumsum(positions).astype(numpy.int64)
+        else:
+            indices = []
+            pos = gap / 2.0
+            for _ in range(count):
+                indices.append(int(pos))
+                pos += gap
 
-        spec = ",".join([str(x) for x in res])
-        return Sequence.create(spec)
+        return Sequence._from_runs(_take_runs(self._iterable, indices))
 
     def calc_fml(self, count):
         """Take a selection of elements from the sequence.
 
         Return value is a new sequence where the elements are first, middle and last
+        If count covers every frame, the result is a copy of this sequence,
+        with the same chunk settings.
         """
         if count >= self.length:
-            return self._iterable
+            return self._copy()
 
         # Make sure that count is within the range of the list length
         count = max(1, count)
-        res = []
-        res.append(self.start)
+        indices = [0]
         if count == 2:
-            res.append(self.end)
+            indices.append(self.length - 1)
         elif count > 2:
             count -= 1
             bucket = int(self.length / count)
-            for i in range(1, count):
-                index = i * bucket
-                res.append(self._iterable[index])
-            res.append(self.end)
+            indices += range(bucket, count * bucket, bucket)
+            indices.append(self.length - 1)
 
-        spec = ",".join([str(x) for x in res])
-        return Sequence.create(spec)
+        return Sequence._from_runs(_take_runs(self._iterable, sorted(set(indices))))
 
     def best_chunk_size(self):
         """Determine the best distribution of frames per chunk based on the
@@ -483,24 +3058,18 @@ class Sequence(object):
         sequence, if any, into comma delimited frame numbers.
         
         Katana requires this format for stepped sequences.
+
+        Parts are built from the cached progressions, so the minus sign
+        of a negative frame is never mistaken for a range separator.
         """
         
-        spec = str(self)
-        if step_sep == "":
-            new_parts = []
-            parts=str(self).split(",")
-            for part in parts:
-                if "x" in part:
-                    part = ",".join([str(int(x)) for x in Sequence.create(part)])
-                new_parts.append(part)
-            spec = ",".join(new_parts)
-                
-        return (
-            spec
-            .replace("-", range_sep)
-            .replace("x", step_sep)
-            .replace(",", block_sep)
-        )
+        parts = []
+        for start, end, step in self._progression_runs():
+            if step_sep == "" and step > 1 and start != end:
+                parts += [str(frame) for frame in range(start, end + 1, step)]
+            else:
+                parts.append(_run_spec(start, end, step, range_sep, step_sep))
+        return block_sep.join(parts)
 
     @property
     def chunk_size(self):
@@ -518,6 +3087,25 @@ class Sequence(object):
         value=int(value)
         num = len(self._iterable)
         self._chunk_size = num if value < 1 else sorted([num, value])[0]
+        self._invalidate_chunks()
+
+    @property
+    def chunk_costs(self):
+        """Return the costs used by the balanced strategies, if any."""
+        return self._chunk_costs
+
+    @chunk_costs.setter
+    def chunk_costs(self, value):
+        """Set the costs used by the balanced strategies.
+
+        A dict whose keys are frames, or specs, ranges and Sequences of
+        frames, and whose values are the cost of each of those frames,
+        e.g. render times. Later keys override earlier ones. Frames
+        with no cost get the mean cost. The dict is copied, so set it
+        again to change costs.
+        """
+        self._chunk_costs = None if value is None else dict(value)
+        self._invalidate_chunks()
 
     @property
     def chunk_strategy(self):
@@ -528,6 +3116,7 @@ class Sequence(object):
     def chunk_strategy(self, value):
         """Set strategy for emitting chunks."""
         self._chunk_strategy = value
+        self._invalidate_chunks()
 
     def __iter__(self):
         return iter(self._iterable)
@@ -535,9 +3124,29 @@ class Sequence(object):
     def __len__(self):
         return len(self._iterable)
 
+    def __contains__(self, frame):
+        return frame in self._iterable
+
     def __str__(self):
         """String representation contains the stringified progressions."""
-        progs = Progression.factory(self._iterable)
+        if self._spec is None:
+            self._spec = (",").join(
+                [_run_spec(*run) for run in self._progression_runs()]
+            )
+        return self._spec
+
+    def spec(self, mode="greedy"):
+        """Return a frame spec string.
+
+        The default greedy mode gives the same string as str(). Use
+        mode="optimal" to split the frames into the consecutive
+        progressions that give the shortest spec, which is useful when
+        the spec goes on a command line. Interleaved progressions, such
+        as 1-9x2,4, are not searched. See Progression.factory().
+        """
+        if mode == "greedy":
+            return str(self)
+        progs = Progression.factory(self, mode=mode)
         return (",").join([str(p) for p in progs])
 
     def __repr__(self):
@@ -549,27 +3158,32 @@ class Sequence(object):
 
 
 class Progression(Sequence):
+    __slots__ = ()
+
     def __init__(self, _shield, start, end, step, **kw):
         self._iterable = range(start, end + 1, step)
         self.chunk_size = kw.get("chunk_size", -1)
         self._chunk_strategy = kw.get("chunk_strategy", "linear")
+        self.chunk_costs = kw.get("chunk_costs")
 
     @property
     def step(self):
         if self.start == self.end:
             return 1
-        return self._iterable[1] - self._iterable[0]
+        return self._iterable.step
+
+    def _runs(self):
+        return [(self.start, self.end, self.step)]
+
+    def _progression_runs(self):
+        return self._runs()
 
     @property
     def range(self):
         return (self.start, self.end, self.step)
 
     def __str__(self):
-        if self.start == self.end:
-            return str(self.start)
-        if self.step == 1:
-            return "%s-%s" % (self.start, self.end)
-        return "%s-%sx%s" % (self.start, self.end, self.step)
+        return _run_spec(self.start, self.end, self.step)
 
     @staticmethod
     def factory(iterable, **kw):
@@ -581,83 +3195,380 @@ class Progression(Sequence):
         sorted sequence, gathers elements with the same gap as the
         previous element. The max size keyword arg will limit the length
         of progressions.
-        """
-        max_size = kw.get("max_size", len(iterable))
-        iterable = sorted(iterable)
 
-        if max_size == 1:
-            return [Sequence.create(prog) for prog in iterable]
+        A Sequence or range is consumed run by run without sorting, so
+        the cost is linear in the number of runs and progressions
+        produced. Other iterables are sorted first.
+
+        With mode="optimal" the frames are split into the consecutive
+        progressions that give the shortest spec string instead. See
+        _optimal_progressions(). If there are more frames than the
+        budget keyword arg (default OPTIMAL_BUDGET), the greedy result
+        is returned.
+        """
+        mode = kw.get("mode", "greedy")
+        if mode not in ("greedy", "optimal"):
+            raise ValueError("Mode must be 'greedy' or 'optimal'")
 
+        max_size = kw.get("max_size", len(iterable))
         if max_size < 1:
             max_size = len(iterable)
 
-        results = [[]]
-
-        # add a sentinel to the end - see below
-        iterable.append(-1)
-        prog = 0
-        for element in iterable:
-            # if not adding to current progression, create a new progression.
-            if not _should_add(element, results[prog], max_size):
-                last_prog = prog
-                prog += 1
-                results.append([])
-
-                # if the last progression only has 2 elements, then steal
-                # the second of them to start this progression. Why? because
-                # we are greedy and will have more chance of making longer
-                # progressions if we dismantle progressions of length 2 and
-                # then pair up the straggling singles later.
-                # Note that the sentinel added above ensures this rule also
-                # works on the original last element.
-                if len(results[last_prog]) == 2:
-                    results[prog].append(results[last_prog][1])
-                    results[last_prog] = results[last_prog][:1]
-
-            results[prog].append(element)
-
-        # remove the sentinel from the last progression,
-        # or remove the whole last
-        # progression if it contains only the sentinel.
-        if len(results[prog]) == 1:
-            results = results[:-1]
+        if isinstance(iterable, Sequence):
+            runs = iterable._runs()
+        elif isinstance(iterable, range) and iterable.step > 0:
+            runs = [_normalize_run(iterable[0], iterable[-1], iterable.step)] if iterable else []
         else:
-            results[prog] = results[prog][:-1]
-
-        # Now join straggling singles into pairs if possible. Loop
-        # through the singles, joining every other one to the one
-        # before. In theory we could recurse here - looking for
-        # longer progressions in the stragglers.
-        singles = []
-        j = 0
-        for i in range(len(results)):
-            if len(results[j]) == 1:
-                singles.append(results.pop(j)[0])
-            else:
-                j += 1
+            runs = _runs_from_frames(sorted(set(iterable)))
 
-        for i, single in enumerate(singles):
-            if i % 2 == 0:
-                results.append([single])
+        if max_size > 1 and mode == "optimal" and len(iterable) <= kw.get(
+            "budget", OPTIMAL_BUDGET
+        ):
+            progressions = _optimal_progressions(runs, max_size)
+        else:
+            progressions = _iter_progressions(runs, max_size)
+
+        return [Sequence._progression(*prog) for prog in progressions]
+
+
+def _iter_progressions(runs, max_size):
+    """Generate the runs of the greedy factory, in order."""
+    if max_size == 1:
+        for start, end, step in runs:
+            for frame in range(start, end + 1, step):
+                yield (frame, frame, 1)
+    else:
+        for prog in _pair_singles(_greedy_progressions(runs, max_size)):
+            yield prog
+
+
+def _count_progressions(runs, max_size):
+    """Count the progressions the greedy factory would make."""
+    if max_size == 1:
+        return sum(_run_length(*run) for run in runs)
+    progressions = singles = 0
+    for start, end, _ in _greedy_progressions(runs, max_size):
+        if start == end:
+            singles += 1
+        else:
+            progressions += 1
+    return progressions + (singles + 1) // 2
+
+
+def _greedy_progressions(runs, max_size):
+    """Walk sorted runs and yield greedy progressions in order.
+
+    A progression grows while the gap to the next frame matches its
+    step. If a progression with only 2 elements is broken, its second
+    element is stolen to start the next progression. Why? because we
+    are greedy and will have more chance of making longer progressions
+    if we dismantle progressions of length 2 and then pair up the
+    straggling singles later. See _pair_singles().
+
+    When a progression continues with the same step as the run being
+    consumed, the run is absorbed in one go, up to max_size, so whole
+    runs are not walked frame by frame.
+    """
+    first = last = step = None
+    count = 0
+    for start, end, run_step in runs:
+        while start <= end:
+            if count < 2:
+                if count == 0:
+                    first = start
+                else:
+                    step = start - first
+                last = start
+                count += 1
+            elif count < max_size and start - last == step:
+                if run_step == step:
+                    num = min((end - start) // step + 1, max_size - count)
+                    last = start + (num - 1) * step
+                    count += num
+                    start = last + run_step
+                    continue
+                last = start
+                count += 1
+            elif count == 2:
+                yield (first, first, 1)
+                first, step, last = last, start - last, start
             else:
-                results[-1].append(single)
+                yield (first, last, step)
+                first = last = start
+                count = 1
+            start += run_step
+
+    if count == 2:
+        yield (first, first, 1)
+        yield (last, last, 1)
+    elif count == 1:
+        yield (first, first, 1)
+    elif count > 2:
+        yield (first, last, step)
+
+
+def _optimal_progressions(runs, max_size):
+    """Return the split into consecutive progressions that makes the
+    shortest spec string.
+
+    Dynamic programming over the sorted frames, where each progression
+    is a run of consecutive frames. Progressions that interleave, such
+    as 1-9x2,4 for 1,3,4,5,7,9, are not considered, so this is not
+    always the shortest spec of all. A progression ending at frame j can
+    only start inside the streak of equal gaps that ends at j, so the
+    best start is kept in a sliding window minimum and the whole thing
+    is linear in the number of frames. Ties in length go to the answer
+    with fewer progressions.
+
+    When max_size doesn't cut progressions, a progression never starts
+    or ends deep inside a run, as joining it to its neighbours in the
+    run would be no longer. So only the first and last few frames of
+    each run are looked at, and a single run costs constant time.
+
+    The greedy factory's pairs of distant singles never shorten the
+    spec, so the result is never longer than the greedy one.
+    """
+    frames = []
+    # The gap to each frame from the one before, per step of its run.
+    gaps = []
+    whole = max_size >= sum(_run_length(*run) for run in runs)
+    for start, end, step in runs:
+        if frames:
+            gaps.append(start - frames[-1])
+        else:
+            gaps.append(0)
+        if whole and _run_length(start, end, step) > 2 * _OPTIMAL_RUN_EDGE:
+            edge = (_OPTIMAL_RUN_EDGE - 1) * step
+            frames.extend(range(start, start + edge + 1, step))
+            frames.extend(range(end - edge, end + 1, step))
+        else:
+            frames.extend(range(start, end + 1, step))
+        gaps.extend([step] * (len(frames) - len(gaps)))
+
+    num = len(frames)
+    digits = [len(str(frame)) for frame in frames]
+    # Characters dominate the cost, the number of progressions breaks ties.
+    weight = num + 2
+    cost = [0] * (num + 1)
+    choice = [0] * (num + 1)
+    window = collections.deque()
+    for j in range(num):
+        best = cost[j] + (digits[j] + 1) * weight + 1
+        start = j
+        if j:
+            gap = gaps[j]
+            if j > 1 and gap != gaps[j - 1]:
+                window.clear()
+            value = cost[j - 1] + digits[j - 1] * weight
+            while window and window[-1][0] >= value:
+                window.pop()
+            window.append((value, j - 1))
+            while window and window[0][1] <= j - max_size:
+                window.popleft()
+            if window:
+                value, i = window[0]
+                tail = 0 if gap == 1 else 1 + len(str(gap))
+                total = value + (digits[j] + tail + 2) * weight + 1
+                if total < best:
+                    best, start = total, i
+        cost[j + 1] = best
+        choice[j + 1] = start
+
+    result = []
+    j = num
+    while j:
+        i = choice[j]
+        step = gaps[i + 1] if j - 1 > i else 1
+        result.append((frames[i], frames[j - 1], step))
+        j = i
+    result.reverse()
+    return result
+
+
+def _smallest_chunk_size(lengths, singles, low, high, max_count):
+    """Binary search for the smallest chunk size that gives no more than
+    max_count chunks.
+
+    lengths counts progressions by length, and each is cut into pieces
+    no longer than the chunk size. singles are paired. Returns None if
+    high gives too many chunks.
+    """
 
-        results.sort(key=lambda v: v[0])
+    def count(size):
+        pieces = sum(num * -(-length // size) for length, num in lengths.items())
+        return pieces + (singles + 1) // 2
 
-        return [Sequence.create(prg) for prg in results]
+    if count(high) > max_count:
+        return None
+    while low < high:
+        mid = (low + high) // 2
+        if count(mid) <= max_count:
+            high = mid
+        else:
+            low = mid + 1
+    return low
 
 
-def _should_add(element, progression, max_size):
-    """Should an element be added to a progression?
+def _pair_singles(progressions):
+    """Join straggling singles into pairs, keeping progressions sorted.
 
-    Specifically, if the progression has 0 or 1 elements, then add it,
-    as this starts the progression. Otherwise check if the gap between
-    the element and the last in the progression is the same as the gap
-    in the rest of the progression.
+    Every other single is joined to the one before. Progressions that
+    arrive while a single waits for its partner are held back, since
+    the pair sorts before them.
     """
-    if len(progression) < 2:
-        return True
-    if len(progression) == max_size:
-        return False
-    return progression[1] - progression[0] == element - progression[-1]
+    pending = None
+    held = []
+    for prog in progressions:
+        if prog[0] != prog[1]:
+            if pending is None:
+                yield prog
+            else:
+                held.append(prog)
+        elif pending is None:
+            pending = prog[0]
+        else:
+            yield (pending, prog[0], prog[0] - pending)
+            pending = None
+            for prog in held:
+                yield prog
+            held = []
+    if pending is not None:
+        yield (pending, pending, 1)
+        for prog in held:
+            yield prog
+
+
+def _chunk_weights(frames, runs, costs):
+    """Return the cost of each frame, in order, as an array of floats.
+
+    costs maps frames, or specs, ranges and Sequences, to a cost per
+    frame. Later keys override earlier ones. Frames with no cost get
+    the mean cost of those that have one, or 1 if none do. Raises
+    ValueError if a cost is negative or not finite, or if the total
+    would overflow.
+    """
+    num = len(frames)
+    unset = float("nan")
+    weights = array.array("d", [unset]) * num
+    singles = {}
+    for key, cost in costs.items():
+        cost = float(cost)
+        if not 0 <= cost < float("inf"):
+            raise ValueError("Chunk costs must be finite numbers, not less than 0")
+        if isinstance(key, int):
+            singles[key] = cost
+            continue
+        for start, end, step in _intersect_runs(runs, _runs_of(key)):
+            first = frames.index(start)
+            last = frames.index(end)
+            length = _run_length(start, end, step)
+            if last - first + 1 == length:
+                weights[first : last + 1] = array.array("d", [cost]) * length
+            else:
+                for frame in range(start, end + 1, step):
+                    weights[frames.index(frame)] = cost
+
+    if len(singles) > num // 8:
+        for index, frame in enumerate(frames):
+            cost = singles.get(frame)
+            if cost is not None:
+                weights[index] = cost
+    else:
+        for frame, cost in singles.items():
+            if frame in frames:
+                weights[frames.index(frame)] = cost
+
+    known = [weight for weight in weights if weight == weight]
+    if len(known) < num:
+        default = sum(known) / len(known) if known else 1.0
+        weights = array.array(
+            "d", [weight if weight == weight else default for weight in weights]
+        )
+    # Chunks are balanced with sums of costs, which must not overflow.
+    if sum(weights) == float("inf"):
+        raise ValueError("Chunk costs are too large to add up")
+    return weights
+
+
+def _greedy_parts(prefix, limit, count):
+    """Fill parts in order up to limit, given prefix sums of the weights.
+
+    Returns the largest part, or None if more than count parts are
+    needed, and the smallest limit above this one at which any part
+    could take one more item. Each part is found with a bisect.
+    """
+    num = len(prefix) - 1
+    start = 0
+    parts = 0
+    largest = 0.0
+    nearest = float("inf")
+    while start < num:
+        parts += 1
+        end = bisect.bisect_right(prefix, prefix[start] + limit, start + 1) - 1
+        if end < num:
+            nearest = min(nearest, prefix[end + 1] - prefix[start])
+        if parts > count or end == start:
+            return None, nearest
+        largest = max(largest, prefix[end] - prefix[start])
+        start = end
+    return largest, nearest
+
+
+def _linear_partition(weights, count):
+    """Split weights into count contiguous parts with the smallest largest sum.
+
+    Returns the index where each part starts, then the length. We
+    search for the smallest limit that the greedy fill can meet. It
+    lies between the mean part and the mean plus the largest weight.
+    A fill that fails moves the low end up to where its parts change,
+    and one that succeeds moves the high end down to its largest part,
+    so the search ends on an exact sum. Each fill costs O(count log n).
+    """
+    num = len(weights)
+    prefix = [0.0]
+    prefix.extend(itertools.accumulate(weights))
+    total = prefix[-1]
+    low = max(max(weights), total / count)
+    high = _greedy_parts(prefix, total / count + max(weights), count)[0]
+    if high is None:
+        high = total
+    for _ in range(200):
+        mid = (low + high) / 2
+        if not low < mid < high:
+            break
+        largest, nearest = _greedy_parts(prefix, mid, count)
+        if largest is None:
+            low = nearest
+        else:
+            high = largest
+
+    # Fill again at the best limit, with a little slack for rounding,
+    # leaving at least one item for each part still to come.
+    limit = high + abs(high) * 1e-9
+    bounds = [0]
+    for i in range(count - 1, 0, -1):
+        start = bounds[-1]
+        end = bisect.bisect_right(prefix, prefix[start] + limit, start + 1) - 1
+        bounds.append(max(start + 1, min(end, num - i)))
+    bounds.append(num)
+    return bounds
 
+
+def _lpt_partition(weights, count):
+    """Split weights into count parts with the longest processing time rule.
+
+    The heaviest items go first, each to the part with the least total
+    so far. Parts are lists of sorted indices, ordered by their first.
+    """
+    order = sorted(range(len(weights)), key=weights.__getitem__, reverse=True)
+    # Ties go to the part with fewest items, so that no part is empty.
+    heap = [(0.0, 0, i) for i in range(count)]
+    parts = [[] for _ in range(count)]
+    for index in order:
+        total, size, i = heap[0]
+        parts[i].append(index)
+        heapq.heapreplace(heap, (total + weights[index], size + 1, i))
+    for part in parts:
+        part.sort()
+    parts.sort()
+    return parts
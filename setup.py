@@ -12,7 +12,8 @@ DESCRIPTION = "Manage sequences of frame numbers."
 URL = "https://github.com/ConductorTechnologies/cioseq"
 EMAIL = "info@conductortech.com"
 AUTHOR = "conductor"
-REQUIRED = ["future>=0.18.2"]
+REQUIRED = []
+EXTRAS = {"numpy": ["numpy"]}
 HERE = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -42,17 +43,19 @@ setuptools.setup(
     classifiers=[
         "Operating System :: OS Independent",
         "Programming Language :: Python",
+        "Programming Language :: Python :: 3",
         "Topic :: Multimedia :: Graphics :: 3D Rendering",
     ],
     cmdclass={"build_py": BuildCommand},
     description=DESCRIPTION,
+    extras_require=EXTRAS,
     install_requires=REQUIRED,
     long_description=long_description,
     long_description_content_type="text/markdown",
     name=NAME,
     package_dir={"": "."},
     packages=setuptools.find_packages(where="."),
-    options={"bdist_wheel": {"universal": True}},
+    python_requires=">=3.8",
     include_package_data=True, 
     url=URL,
     version=VERSION,
@@ -2,70 +2,136 @@
 
    isort:skip_file
 """
+import array
+import copy
+import gc
+import io
+import math
 import os
+import pickle
+import random
+import shutil
 import sys
+import tempfile
+import time
 import unittest
+import weakref
 from unittest.mock import patch
 
 # SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
 # if SRC not in sys.path:
 #     sys.path.insert(0, SRC)
 
-from cioseq.sequence import Progression, Sequence, _resolve_frames
-
-
-class ResolveFramesTest(unittest.TestCase):
+from cioseq.sequence import (
+    ChunkIndex,
+    FrameScanner,
+    Progression,
+    Sequence,
+    _ChunkPlanCache,
+    _FrameBitmap,
+    _FrameRuns,
+    _FrameView,
+    _count_progressions,
+    _resolve_runs,
+    clear_chunk_cache,
+    clear_listing_cache,
+    compile_template,
+    disable_listing_cache,
+    enable_listing_cache,
+    find_sequences,
+    get_backend,
+    listing_cache_info,
+    set_backend,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ResolveRunsTest(unittest.TestCase):
     def test_single_integer(self):
-        s = _resolve_frames(1)
+        s = _FrameRuns(_resolve_runs(1))
         self.assertEqual(s[0], 1)
         self.assertEqual(len(s), 1)
 
     def test_integer_range_args(self):
-        s = _resolve_frames(1, 5)
+        s = _FrameRuns(_resolve_runs(1, 5))
         self.assertEqual(s[0], 1)
         self.assertEqual(s[4], 5)
         self.assertEqual(len(s), 5)
 
     def test_integer_range_step_args(self):
-        s = _resolve_frames(1, 5, 2)
+        s = _FrameRuns(_resolve_runs(1, 5, 2))
         self.assertEqual(s[0], 1)
         self.assertEqual(s[2], 5)
         self.assertEqual(len(s), 3)
 
     def test_sort_integer_range_step_args(self):
-        s = _resolve_frames(5, 1, 2)
+        s = _FrameRuns(_resolve_runs(5, 1, 2))
         self.assertEqual(s[0], 1)
         self.assertEqual(s[2], 5)
         self.assertEqual(len(s), 3)
 
     def test_negative_integer_args(self):
-        s = _resolve_frames(-5, -1, 2)
+        s = _FrameRuns(_resolve_runs(-5, -1, 2))
         self.assertEqual(s[0], -5)
         self.assertEqual(s[2], -1)
         self.assertEqual(len(s), 3)
 
     def test_array(self):
-        s = _resolve_frames([1, 2, 6, 4])
+        s = _FrameRuns(_resolve_runs([1, 2, 6, 4]))
         self.assertEqual(s[0], 1)
         self.assertEqual(s[2], 4)
         self.assertEqual(len(s), 4)
 
     def test_single_number_spec(self):
-        s = _resolve_frames("3")
+        s = _FrameRuns(_resolve_runs("3"))
         self.assertEqual(s[0], 3)
         self.assertEqual(len(s), 1)
 
     def test_range_spec(self):
-        s = _resolve_frames("1-3")
+        s = _FrameRuns(_resolve_runs("1-3"))
         self.assertEqual(s[0], 1)
         self.assertEqual(len(s), 3)
 
     def test_range_step_spec(self):
-        s = _resolve_frames("1-5x2")
+        s = _FrameRuns(_resolve_runs("1-5x2"))
         self.assertEqual(s[0], 1)
         self.assertEqual(s[2], 5)
         self.assertEqual(len(s), 3)
 
+    def test_huge_spec_is_not_expanded(self):
+        s = _FrameRuns(_resolve_runs("1-5000000, 6000000-9000000x2"))
+        self.assertEqual(s.runs, [(1, 5000000, 1), (6000000, 9000000, 2)])
+        self.assertEqual(len(s), 6500001)
+
+    def test_overlapping_ranges_merge(self):
+        s = _FrameRuns(_resolve_runs("20-30, 1-10, 5-25"))
+        self.assertEqual(s.runs, [(1, 30, 1)])
+
+    def test_adjacent_ranges_merge(self):
+        s = _FrameRuns(_resolve_runs("1-10, 11-20"))
+        self.assertEqual(s.runs, [(1, 20, 1)])
+
+    def test_stepped_range_inside_range_is_dropped(self):
+        s = _FrameRuns(_resolve_runs("1-1000000, 10-500000x7"))
+        self.assertEqual(s.runs, [(1, 1000000, 1)])
+
+    def test_stepped_range_contained_in_stepped_range(self):
+        s = _FrameRuns(_resolve_runs("1-1000000x2, 5-5001x4"))
+        self.assertEqual(s.runs, [(1, 999999, 2)])
+
+    def test_stepped_ranges_overlapping(self):
+        s = _FrameRuns(_resolve_runs("1-20x2, 2-20x3, 12"))
+        expected = sorted(set(range(1, 21, 2)) | set(range(2, 21, 3)) | {12})
+        self.assertEqual(list(s), expected)
+
+    def test_stepped_range_end_snaps_to_last_frame(self):
+        s = _FrameRuns(_resolve_runs("0-10x3"))
+        self.assertEqual(s.runs, [(0, 9, 3)])
+
 
 class SequenceFactoryTest(unittest.TestCase):
     def test_single_number_is_progression(self):
@@ -109,6 +175,41 @@ class SequenceFactoryTest(unittest.TestCase):
         self.assertFalse(s.is_progression())
 
 
+class HugeProgressionTest(unittest.TestCase):
+    def test_three_integer_form(self):
+        s = Sequence.create(1, 10 ** 12, 3)
+        self.assertIsInstance(s, Progression)
+        self.assertEqual(len(s), 333333333334)
+        self.assertEqual(s.end, 10 ** 12)
+        self.assertEqual(s.step, 3)
+        self.assertEqual(s[-2], 10 ** 12 - 3)
+        self.assertEqual(str(s), "1-1000000000000x3")
+
+    def test_single_token_spec(self):
+        s = Sequence.create("1-1000000000000")
+        self.assertIsInstance(s, Progression)
+        self.assertEqual(len(s), 10 ** 12)
+
+    def test_range_argument(self):
+        s = Sequence.create(range(0, 10 ** 12, 5))
+        self.assertIsInstance(s, Progression)
+        self.assertEqual(s.range, (0, 10 ** 12 - 5, 5))
+
+    def test_reversed_range_argument(self):
+        s = Sequence.create(range(10, 0, -3))
+        self.assertEqual(list(s), [1, 4, 7, 10])
+
+    def test_empty_range_argument(self):
+        with self.assertRaises(TypeError):
+            Sequence.create(range(0))
+
+    def test_copy_keeps_runs(self):
+        s = Sequence.create("1-1000000000000, 2000000000000")
+        s2 = Sequence.create(s)
+        self.assertIsNot(s2, s)
+        self.assertEqual(s2._runs(), s._runs())
+
+
 class SequenceFactoryFailTest(unittest.TestCase):
     def test_negative_step(self):
         with self.assertRaises(ValueError):
@@ -230,6 +331,16 @@ class SequenceToStringTest(unittest.TestCase):
         s = Sequence.create("1-10, 14, 20-48x4")
         self.assertEqual(repr(s), "Sequence.create('1-10,14,20-48x4')")
 
+    def test_spec_is_cached(self):
+        s = Sequence.create("1-10, 14, 20-48x4")
+        self.assertIs(str(s), str(s))
+
+    def test_spec_cached_after_chunk_size_change(self):
+        s = Sequence.create("1-10, 14, 20-48x4")
+        spec = str(s)
+        s.chunk_size = 3
+        self.assertIs(str(s), spec)
+
 
 class ChunksTest(unittest.TestCase):
     def test_no_chunk_size(self):
@@ -332,6 +443,58 @@ class ChunksTest(unittest.TestCase):
         self.assertEqual(s.chunk_count(), 3)
         self.assertEqual(s.chunk_size, 34)
         
+    def test_cycle_progressions_count_matches_chunks(self):
+        s = Sequence.create("1-1001x3,135-149x2,379,454", chunk_size=10)
+        s.chunk_strategy = "cycle_progressions"
+        self.assertEqual(s.chunk_count(), len(s.chunks()))
+
+    def test_progression_count_matches_chunks(self):
+        s = Sequence.create("1-3,6-12x2,13,14-36x3,40,45,47,100-120")
+        s.chunk_strategy = "progressions"
+        for chunk_size in range(1, 12):
+            s.chunk_size = chunk_size
+            self.assertEqual(s.chunk_count(), len(s.chunks()))
+
+    def test_progression_count_of_huge_sequence(self):
+        s = Sequence.create("1-1000000000, 1000000005", chunk_size=10000000)
+        s.chunk_strategy = "progressions"
+        self.assertEqual(s.chunk_count(), 101)
+
+    def test_cap_chunk_count_progressions(self):
+        s = Sequence.create("1-3,6-12x2,13,14-36x3,40,45,47,100-120")
+        s.chunk_strategy = "progressions"
+        s.chunk_size = 2
+        s.cap_chunk_count(6)
+        self.assertLessEqual(s.chunk_count(), 6)
+        s.chunk_size -= 1
+        self.assertGreater(s.chunk_count(), 6)
+
+    def test_cap_chunk_count_progressions_unreachable(self):
+        s = Sequence.create("1-3,6-12x2,13,14-36x3,40,45,47,100-120")
+        s.chunk_strategy = "progressions"
+        s.chunk_size = 2
+        s.cap_chunk_count(1)
+        self.assertEqual(s.chunk_size, len(s))
+
+    def test_cap_chunk_count_progressions_unreachable_stops_early(self):
+        s = Sequence.create(list(range(0, 3000, 7)) + [1, 4, 9, 15, 30, 50])
+        s.chunk_strategy = "progressions"
+        s.chunk_size = 2
+        with patch(
+            "cioseq.sequence._count_progressions", wraps=_count_progressions
+        ) as counter:
+            s.cap_chunk_count(2)
+        self.assertEqual(counter.call_count, 1)
+        self.assertEqual(s.chunk_size, len(s))
+
+    def test_cap_chunk_count_cycle_progressions(self):
+        s = Sequence.create("1-1001x3,135-149x2,379,454", chunk_size=2)
+        s.chunk_strategy = "cycle_progressions"
+        s.cap_chunk_count(20)
+        self.assertLessEqual(s.chunk_count(), 20)
+        s.chunk_size -= 1
+        self.assertGreater(s.chunk_count(), 20)
+
     def test_doesnt_cap_chunk_count_when_not_exceded(self):
         s = Sequence.create("1-100")
         s.chunk_size = 3
@@ -339,6 +502,182 @@ class ChunksTest(unittest.TestCase):
         self.assertEqual(s.chunk_count(), 34)
         self.assertEqual(s.chunk_size, 3)
 
+class IterChunksTest(unittest.TestCase):
+    def test_is_lazy(self):
+        s = Sequence.create(1, 10 ** 12, chunk_size=1)
+        chunks = s.iter_chunks()
+        self.assertEqual(list(next(chunks)), [1])
+        self.assertEqual(list(next(chunks)), [2])
+
+    def test_cycle_is_lazy(self):
+        s = Sequence.create("1-1000000000, 1000000005", chunk_size=2)
+        s.chunk_strategy = "cycle"
+        chunk = next(s.iter_chunks())
+        self.assertEqual(list(chunk), [1, 500000002])
+
+    def test_same_as_chunks_for_all_strategies(self):
+        s = Sequence.create("1-3,6-12x2,13,14-36x3,40,45,47", chunk_size=4)
+        for strategy in ["linear", "cycle", "progressions", "cycle_progressions"]:
+            s.chunk_strategy = strategy
+            expected = [list(c) for c in s.chunks()]
+            result = [list(c) for c in s.iter_chunks()]
+            self.assertEqual(result, expected)
+
+
+class ChunkViewTest(unittest.TestCase):
+    def setUp(self):
+        self.s = Sequence.create("1-20x3, 30, 41-45, 50-90x10", chunk_size=4)
+
+    def test_chunk_shares_parent_storage(self):
+        chunk = self.s.chunks()[1]
+        self.assertIsInstance(chunk._iterable, _FrameView)
+        self.assertIs(chunk._iterable.frames, self.s._iterable)
+
+    def test_runs_are_lazy(self):
+        chunk = self.s.chunks()[1]
+        self.assertIsNone(chunk._iterable._runs)
+        self.assertEqual(str(chunk), "13-19x3,30")
+        self.assertEqual(chunk._iterable.runs, [(13, 19, 3), (30, 30, 1)])
+
+    def test_pickled_chunk_does_not_hold_parent(self):
+        rnd = random.Random(1)
+        small = [f for f in range(2000) if rnd.random() < 0.5]
+        sizes = []
+        for extra in [0, 20000]:
+            s = Sequence.create(
+                small + [f * f for f in range(2000, 2000 + extra)], chunk_size=10
+            )
+            chunk = s.chunks()[0]
+            self.assertIsInstance(chunk._iterable, _FrameView)
+            loaded = pickle.loads(pickle.dumps(chunk))
+            self.assertEqual(list(loaded), list(chunk))
+            self.assertEqual(loaded.chunk_size, 10)
+            sizes.append(len(pickle.dumps(chunk)))
+        self.assertEqual(sizes[0], sizes[1])
+
+    def test_progression_chunks_are_not_views(self):
+        chunk = self.s.chunks()[0]
+        self.assertIsInstance(chunk, Progression)
+        self.assertEqual(list(chunk), [1, 4, 7, 10])
+
+    def test_view_of_view_uses_root_storage(self):
+        self.s.chunk_strategy = "cycle"
+        chunk = self.s.chunks()[0]
+        chunk.chunk_size = 3
+        sub = chunk.chunks()[0]
+        self.assertEqual(list(sub), [1, 16, 43])
+        self.assertIs(sub._iterable.frames, self.s._iterable)
+
+    def test_view_membership_and_indexing(self):
+        self.s.chunk_strategy = "cycle"
+        chunk = self.s.chunks()[1]
+        frames = list(chunk)
+        self.assertEqual(frames, [4, 19, 44, 80])
+        self.assertIn(44, chunk._iterable)
+        self.assertNotIn(43, chunk._iterable)
+        self.assertEqual(chunk[-1], 80)
+
+
+class ChunkPlanCacheTest(unittest.TestCase):
+    def setUp(self):
+        clear_chunk_cache()
+
+    def test_chunks_are_reused(self):
+        s = Sequence.create("1-100", chunk_size=10)
+        first = s.chunks()
+        second = s.chunks()
+        self.assertIsNot(first, second)
+        self.assertEqual([str(c) for c in first], [str(c) for c in second])
+
+    def test_changing_a_chunk_does_not_change_the_plan(self):
+        s = Sequence.create("1-100", chunk_size=10)
+        chunk = s.chunks()[0]
+        chunk.chunk_size = 2
+        chunk.chunk_strategy = "cycle"
+        again = s.chunks()[0]
+        self.assertEqual(again.chunk_size, 10)
+        self.assertEqual(again.chunk_strategy, "linear")
+        self.assertEqual(ChunkIndex(s).frames_of(0).chunk_strategy, "linear")
+
+    def test_pickle_does_not_share_plans(self):
+        s = Sequence.create("1-100", chunk_size=10)
+        s.chunks()
+        data = pickle.dumps(s)
+        clear_chunk_cache()
+        other = Sequence.create("500-600", chunk_size=10)
+        self.assertEqual(str(other.chunks()[0]), "500-509")
+        loaded = pickle.loads(data)
+        self.assertIsNone(loaded._plan)
+        self.assertEqual(str(loaded.chunks()[0]), "1-10")
+        self.assertEqual(loaded.chunk_count(), 10)
+
+    def test_copy_does_not_share_plans(self):
+        s = Sequence.create("1-100", chunk_size=10)
+        s.chunks()
+        other = copy.copy(s)
+        self.assertIsNone(other._plan)
+        self.assertEqual(len(other.chunks()), 10)
+
+    def test_chunk_size_setter_invalidates(self):
+        s = Sequence.create("1-100", chunk_size=10)
+        first = s.chunks()
+        s.chunk_size = 20
+        self.assertEqual(len(s.chunks()), 5)
+        s.chunk_size = 10
+        self.assertIsNot(s.chunks()[0], first[0])
+
+    def test_chunk_strategy_setter_invalidates(self):
+        s = Sequence.create("1-100", chunk_size=10)
+        s.chunks()
+        s.chunk_strategy = "cycle"
+        self.assertEqual(list(s.chunks()[0]), list(range(1, 100, 10)))
+
+    def test_cap_chunk_count_invalidates(self):
+        s = Sequence.create("1-100", chunk_size=10)
+        s.chunks()
+        s.cap_chunk_count(4)
+        self.assertEqual(len(s.chunks()), 4)
+
+    def test_evicts_least_recently_used(self):
+        cache = _ChunkPlanCache(10)
+        a = cache.add((1, 2, 3, 4))
+        b = cache.add((1, 2, 3, 4))
+        cache.touch(a)
+        c = cache.add((1, 2, 3, 4))
+        self.assertIsNone(b.chunks)
+        self.assertIsNotNone(a.chunks)
+        self.assertIsNotNone(c.chunks)
+        self.assertEqual(len(cache), 2)
+
+    def test_does_not_cache_plans_over_limit(self):
+        cache = _ChunkPlanCache(3)
+        self.assertIsNone(cache.add((1, 2, 3, 4)))
+
+    def test_plans_go_away_with_their_sequence(self):
+        cache = _ChunkPlanCache(100)
+        with patch("cioseq.sequence._chunk_plans", cache):
+            s = Sequence.create([f * f for f in range(1000)], chunk_size=200)
+            s.chunks()
+            self.assertEqual(len(cache), 1)
+            plan = weakref.ref(s._plan)
+            del s
+            gc.collect()
+        self.assertIsNone(plan())
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache._size, 0)
+
+    def test_evicted_plans_are_remade(self):
+        cache = _ChunkPlanCache(12)
+        with patch("cioseq.sequence._chunk_plans", cache):
+            first = Sequence.create("1-100", chunk_size=10)
+            second = Sequence.create("1-100", chunk_size=10)
+            first.chunks()
+            second.chunks()
+            self.assertIsNone(first._plan.chunks)
+            self.assertEqual([str(c) for c in first.chunks()][-1], "91-100")
+            self.assertIsNone(second._plan.chunks)
+
+
 class IntersectionTest(unittest.TestCase):
     def test_does_intersect(self):
         s = Sequence.create("1-10")
@@ -350,6 +689,28 @@ class IntersectionTest(unittest.TestCase):
         i = s.intersection(range(25, 35))
         self.assertEqual(i, None)
 
+    def test_progressions_with_different_steps(self):
+        s = Sequence.create(1, 1000000000000, 6)
+        i = s.intersection(Sequence.create(3, 1000000000000, 4))
+        self.assertEqual(str(i), "7-999999999991x12")
+        self.assertTrue(s.intersects(Sequence.create(3, 1000000000000, 4)))
+
+    def test_progressions_that_never_meet(self):
+        s = Sequence.create(1, 1000000000000, 6)
+        self.assertIsNone(s.intersection(Sequence.create(4, 1000000000000, 4)))
+        self.assertFalse(s.intersects(Sequence.create(4, 1000000000000, 4)))
+
+    def test_intersection_of_runs(self):
+        s = Sequence.create("1-20,30-40x2,51")
+        i = s.intersection("5-33x2,36,50-60")
+        self.assertEqual(list(i), [5, 7, 9, 11, 13, 15, 17, 19, 36, 51])
+
+    def test_keeps_chunk_settings(self):
+        s = Sequence.create("1-100", chunk_size=7, chunk_strategy="cycle")
+        i = s.intersection(range(50, 200))
+        self.assertEqual(i.chunk_size, 7)
+        self.assertEqual(i.chunk_strategy, "cycle")
+
 
 class UnionTest(unittest.TestCase):
     def test_creates_union_from_range(self):
@@ -363,6 +724,67 @@ class UnionTest(unittest.TestCase):
         u = s1.union(s2)
         self.assertEqual(list(u), list(Sequence.create("1-15")))
 
+    def test_interleaved_progressions_merge(self):
+        s = Sequence.create("1-1000000000x2")
+        u = s.union(Sequence.create("2-1000000000x2"))
+        self.assertEqual(str(u), "1-1000000000")
+
+    def test_union_of_stepped_runs(self):
+        s = Sequence.create("1-20x3,40")
+        u = s.union("2-11x3,30-32")
+        self.assertEqual(list(u), [1, 2, 4, 5, 7, 8, 10, 11, 13, 16, 19, 30, 31, 32, 40])
+
+
+class UnionAllTest(unittest.TestCase):
+    def test_merges_task_ranges(self):
+        tasks = [Sequence.create(i * 10 + 1, i * 10 + 10) for i in range(1000)]
+        u = Sequence.union_all(reversed(tasks))
+        self.assertEqual(str(u), "1-10000")
+
+    def test_matches_chained_union(self):
+        items = ["1-20x3,40", "2-11x3,30-32", range(35, 38), [100, 90, 80]]
+        u = Sequence.union_all(items)
+        expected = Sequence.create(items[0])
+        for item in items[1:]:
+            expected = expected.union(item)
+        self.assertEqual(list(u), list(expected))
+        self.assertEqual(str(u), str(expected))
+
+    def test_reads_sequence_runs_lazily(self):
+        rnd = random.Random(2)
+        bitmap = Sequence.create([f for f in range(20000) if rnd.random() < 0.5])
+        table = Sequence.create([f * f for f in range(2000)], chunk_size=300)
+        view = table.chunks()[2]
+        items = [bitmap, table, view, Sequence.create("5-50000x7")]
+        expected = items[0]
+        for item in items[1:]:
+            expected = expected.union(item)
+        no_lists = property(lambda storage: self.fail("runs were listed"))
+        with patch.object(_FrameRuns, "runs", no_lists), patch.object(
+            _FrameBitmap, "runs", no_lists
+        ):
+            u = Sequence.union_all(items)
+        self.assertEqual(list(u), list(expected))
+
+    def test_passes_chunk_settings(self):
+        u = Sequence.union_all(["1-10", "20-30"], chunk_size=4)
+        self.assertEqual(u.chunk_size, 4)
+
+    def test_none_if_empty(self):
+        self.assertIsNone(Sequence.union_all([]))
+
+
+class IntersectionAllTest(unittest.TestCase):
+    def test_common_frames(self):
+        i = Sequence.intersection_all(["1-100", "50-200x2", range(0, 1000, 3)])
+        self.assertEqual(list(i), [54, 60, 66, 72, 78, 84, 90, 96])
+
+    def test_none_if_nothing_in_common(self):
+        self.assertIsNone(Sequence.intersection_all(["1-10", "5-20", "11-30"]))
+
+    def test_none_if_empty(self):
+        self.assertIsNone(Sequence.intersection_all([]))
+
 
 class DifferenceTest(unittest.TestCase):
     def test_removes_sequence_from_other_sequence(self):
@@ -389,6 +811,21 @@ class DifferenceTest(unittest.TestCase):
         d = s1.difference(s2)
         self.assertIsNot(d, s1)
 
+    def test_removes_block_from_huge_range(self):
+        s = Sequence.create("1-1000000000")
+        d = s.difference("500-600,700")
+        self.assertEqual(str(d), "1-499,601-699,701-1000000000")
+
+    def test_removes_every_other_frame(self):
+        s = Sequence.create(1, 1000000000000, 6)
+        d = s.difference(Sequence.create(1, 1000000000000, 12))
+        self.assertEqual(str(d), "7-999999999991x12")
+
+    def test_removes_spread_out_frames(self):
+        s = Sequence.create("1-20")
+        d = s.difference("3-18x5")
+        self.assertEqual(list(d), [1, 2, 4, 5, 6, 7, 9, 10, 11, 12, 14, 15, 16, 17, 19, 20])
+
 
 class ChunkIntersectionTest(unittest.TestCase):
     def test_intersecting_chunks(self):
@@ -418,6 +855,445 @@ class ChunkIntersectionTest(unittest.TestCase):
         self.assertEqual(len(result), 2)
         self.assertEqual(list(result[0]), [-10, -9, -8, -7, -6])
 
+    def test_intersecting_cycle_chunks(self):
+        s = Sequence.create("1-50", chunk_size=5, chunk_strategy="cycle")
+        result = s.intersecting_chunks([3, 13, 50])
+        self.assertEqual([str(c) for c in result], ["3-43x10", "10-50x10"])
+
+    def test_intersecting_progression_chunks(self):
+        s = Sequence.create(
+            "1-20,22-40x2,45,51", chunk_size=6, chunk_strategy="progressions"
+        )
+        result = s.intersecting_chunks("7,30-40,51")
+        expected = [c for c in s.chunks() if c.intersects("7,30-40,51")]
+        self.assertEqual([str(c) for c in result], [str(c) for c in expected])
+
+    def test_intersecting_cycle_progression_chunks(self):
+        s = Sequence.create(
+            "1-20,22-40x2,45,51", chunk_size=4, chunk_strategy="cycle_progressions"
+        )
+        result = s.intersecting_chunks([2, 24, 51])
+        expected = [c for c in s.chunks() if c.intersects([2, 24, 51])]
+        self.assertEqual([str(c) for c in result], [str(c) for c in expected])
+
+    def test_intersecting_chunks_of_huge_sequence(self):
+        s = Sequence.create(1, 1000000000000, chunk_size=1000)
+        result = s.intersecting_chunks([1, 2, 999999999999])
+        self.assertEqual(
+            [str(c) for c in result], ["1-1000", "999999999001-1000000000000"]
+        )
+
+    def test_intersecting_chunks_with_range(self):
+        s = Sequence.create("1-100", chunk_size=10)
+        result = s.intersecting_chunks(range(15, 36))
+        self.assertEqual([str(c) for c in result], ["11-20", "21-30", "31-40"])
+
+
+class ChunkIndexTest(unittest.TestCase):
+    STRATEGIES = [
+        "linear",
+        "cycle",
+        "progressions",
+        "cycle_progressions",
+        "balanced",
+        "balanced_lpt",
+    ]
+
+    def test_matches_chunks(self):
+        for strategy in self.STRATEGIES:
+            for chunk_size in [1, 3, 7]:
+                s = Sequence.create(
+                    "1-20,22-40x2,45,51,60-100x7,101,103",
+                    chunk_size=chunk_size,
+                    chunk_strategy=strategy,
+                )
+                index = ChunkIndex(s)
+                chunks = s.chunks()
+                self.assertEqual(len(index), len(chunks))
+                for chunk_id, chunk in enumerate(chunks):
+                    self.assertEqual(str(index.frames_of(chunk_id)), str(chunk))
+                    for frame in chunk:
+                        self.assertEqual(index.chunk_of(frame), chunk_id)
+
+    def test_chunk_of_missing_frame(self):
+        index = ChunkIndex(Sequence.create("1-10x2", chunk_size=2))
+        self.assertIsNone(index.chunk_of(2))
+        self.assertIsNone(index.chunk_of(100))
+
+    def test_chunks_of_many_frames(self):
+        index = ChunkIndex(Sequence.create("1-100", chunk_size=10))
+        self.assertEqual(index.chunks_of([5, 55, 5, 100, 200]), [0, 5, 0, 9, None])
+
+    def test_huge_sequence(self):
+        index = ChunkIndex(Sequence.create(1, 1000000000000, chunk_size=1000))
+        self.assertEqual(index.chunk_of(999999999999), 999999999)
+        self.assertEqual(str(index.frames_of(-1)), "999999999001-1000000000000")
+
+    def test_frames_of_bad_chunk_id(self):
+        index = ChunkIndex(Sequence.create("1-100", chunk_size=10))
+        with self.assertRaises(IndexError):
+            index.frames_of(10)
+
+
+class BalancedChunksTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        self.costs = {frame: rnd.choice([1, 1, 1, 2, 5, 20]) for frame in range(1, 501)}
+
+    def chunk_costs(self, chunks):
+        return [sum(self.costs[frame] for frame in chunk) for chunk in chunks]
+
+    def test_same_count_as_linear(self):
+        for chunk_size in [1, 7, 50, 499, 1000]:
+            for strategy in ["balanced", "balanced_lpt"]:
+                s = Sequence.create(
+                    "1-500",
+                    chunk_size=chunk_size,
+                    chunk_strategy=strategy,
+                    chunk_costs=self.costs,
+                )
+                self.assertEqual(len(s.chunks()), s.chunk_count())
+                self.assertEqual(s.chunk_count(), math.ceil(500 / min(chunk_size, 500)))
+
+    def test_contiguous_chunks_cover_sequence(self):
+        s = Sequence.create(
+            "1-500", chunk_size=30, chunk_strategy="balanced", chunk_costs=self.costs
+        )
+        frames = [frame for chunk in s.chunks() for frame in chunk]
+        self.assertEqual(frames, list(range(1, 501)))
+
+    def test_lpt_chunks_cover_sequence(self):
+        s = Sequence.create(
+            "1-500",
+            chunk_size=30,
+            chunk_strategy="balanced_lpt",
+            chunk_costs=self.costs,
+        )
+        frames = sorted(frame for chunk in s.chunks() for frame in chunk)
+        self.assertEqual(frames, list(range(1, 501)))
+
+    def test_beats_linear(self):
+        s = Sequence.create("1-500", chunk_size=30, chunk_costs=self.costs)
+        linear = max(self.chunk_costs(s.chunks()))
+        s.chunk_strategy = "balanced"
+        balanced = max(self.chunk_costs(s.chunks()))
+        s.chunk_strategy = "balanced_lpt"
+        lpt = max(self.chunk_costs(s.chunks()))
+        self.assertLess(balanced, linear)
+        self.assertLessEqual(lpt, balanced)
+
+    def test_balanced_is_optimal(self):
+        # Brute force every way to make 3 contiguous chunks.
+        costs = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3]
+        best = min(
+            max(sum(costs[:i]), sum(costs[i:j]), sum(costs[j:]))
+            for i in range(1, 9)
+            for j in range(i + 1, 10)
+        )
+        s = Sequence.create(
+            "1-10",
+            chunk_size=4,
+            chunk_strategy="balanced",
+            chunk_costs=dict(zip(range(1, 11), costs)),
+        )
+        chunks = s.chunks()
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(max(sum(costs[f - 1] for f in c) for c in chunks), best)
+
+    def test_range_costs(self):
+        s = Sequence.create(
+            "1-100",
+            chunk_size=25,
+            chunk_strategy="balanced",
+            chunk_costs={"1-100": 1, range(51, 101): 3},
+        )
+        self.assertEqual(
+            [str(c) for c in s.chunks()], ["1-50", "51-67", "68-84", "85-100"]
+        )
+
+    def test_missing_costs_use_mean(self):
+        s = Sequence.create(
+            "1-12", chunk_size=6, chunk_strategy="balanced", chunk_costs={1: 4, 2: 2}
+        )
+        self.assertEqual([str(c) for c in s.chunks()], ["1-6", "7-12"])
+
+    def test_no_costs_match_linear(self):
+        s = Sequence.create("1-20x2", chunk_size=4, chunk_strategy="balanced")
+        self.assertEqual(
+            [str(c) for c in s.chunks()],
+            [str(c) for c in Sequence.create("1-20x2", chunk_size=4).chunks()],
+        )
+
+    def test_setting_costs_replans(self):
+        s = Sequence.create("1-10", chunk_size=5, chunk_strategy="balanced")
+        self.assertEqual(str(s.chunks()[0]), "1-5")
+        s.chunk_costs = {"1-2": 10, "3-10": 1}
+        self.assertEqual(str(s.chunks()[0]), "1")
+
+    def test_bad_cost_raises(self):
+        s = Sequence.create(
+            "1-10", chunk_size=5, chunk_strategy="balanced", chunk_costs={3: -1}
+        )
+        with self.assertRaises(ValueError):
+            s.chunks()
+
+    def test_non_finite_cost_raises(self):
+        for cost in [float("inf"), float("nan")]:
+            s = Sequence.create(
+                "1-10", chunk_size=5, chunk_strategy="balanced", chunk_costs={3: cost}
+            )
+            with self.assertRaises(ValueError):
+                s.chunks()
+
+    def test_overflowing_costs_raise(self):
+        s = Sequence.create(
+            "1-10", chunk_size=5, chunk_strategy="balanced", chunk_costs={"1-10": 1e308}
+        )
+        with self.assertRaises(ValueError):
+            s.chunks()
+
+    def test_costs_are_copied(self):
+        costs = {"1-10": 1}
+        s = Sequence.create(
+            "1-10", chunk_size=5, chunk_strategy="balanced", chunk_costs=costs
+        )
+        self.assertEqual(str(s.chunks()[0]), "1-5")
+        costs["1-2"] = 10
+        self.assertEqual(str(s.chunks()[0]), "1-5")
+
+    def test_intersecting_chunks(self):
+        for strategy in ["balanced", "balanced_lpt"]:
+            s = Sequence.create(
+                "1-500", chunk_size=30, chunk_strategy=strategy, chunk_costs=self.costs
+            )
+            chunks = s.chunks()
+            expected = [str(c) for c in chunks if 100 in c or 400 in c]
+            result = s.intersecting_chunks([100, 400])
+            self.assertEqual([str(c) for c in result], expected)
+
+    def test_cap_chunk_count(self):
+        s = Sequence.create(
+            "1-500", chunk_size=10, chunk_strategy="balanced", chunk_costs=self.costs
+        )
+        s.cap_chunk_count(7)
+        self.assertEqual(len(s.chunks()), 7)
+
+
+class BackendTest(unittest.TestCase):
+    FRAMES = [5, 3, 1, 7, 9, 10, 11, 12, 20, 30, 40, 41, 43, 45, 47, 100, 3, 5]
+
+    def tearDown(self):
+        set_backend("auto")
+
+    def results(self):
+        s = Sequence.create(self.FRAMES, chunk_size=4, chunk_strategy="cycle")
+        chunk = s.chunks()[1]
+        return [
+            str(s),
+            str(s.subsample(7)),
+            str(s.calc_fml(5)),
+            str(chunk.subsample(2)),
+            str(s.union(Sequence.create("1-50x3")).union("2-30x5")),
+            ChunkIndex(s).chunks_of(range(0, 110)),
+            ChunkIndex(chunk).chunks_of(range(0, 110)),
+        ]
+
+    def test_bad_backend(self):
+        with self.assertRaises(ValueError):
+            set_backend("fortran")
+
+    def test_python_backend(self):
+        set_backend("python")
+        self.assertEqual(get_backend(), "python")
+        self.assertEqual(
+            self.results()[:3],
+            [
+                "1-9x2,10-12,20-40x10,41-47x2,100",
+                "3-7x4,10-12x2,40-43x3,47",
+                "1-9x8,20-43x23,100",
+            ],
+        )
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_backend_matches_python(self):
+        set_backend("python")
+        expected = self.results()
+        set_backend("numpy")
+        self.assertEqual(self.results(), expected)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_array_input(self):
+        set_backend("numpy")
+        s = Sequence.create(numpy.array([4, 1, 2, 3, 3, 10], dtype=numpy.int32))
+        self.assertEqual(str(s), "1-4,10")
+        self.assertIsInstance(s.start, int)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_backend_frames_beyond_int64(self):
+        set_backend("numpy")
+        frames = [2 ** 63 + 100, 2 ** 63 + 5, 2 ** 63 + 9]
+        expected = sorted(frames)
+        self.assertEqual(list(Sequence.create(frames)), expected)
+        values = numpy.array(frames, dtype=numpy.uint64)
+        self.assertEqual(list(Sequence.create(values)), expected)
+        s = Sequence.create("1-100", chunk_size=10)
+        self.assertEqual(ChunkIndex(s).chunks_of([5, 2 ** 70]), [0, None])
+
+    @unittest.skipIf(numpy is not None, "NumPy is installed")
+    def test_numpy_backend_needs_numpy(self):
+        with self.assertRaises(ImportError):
+            set_backend("numpy")
+
+
+class FrameRunsTest(unittest.TestCase):
+    def test_storage_is_runs(self):
+        s = Sequence.create("1-10, 14, 20-48x4")
+        self.assertEqual(s._runs(), [(1, 10, 1), (14, 20, 6), (24, 48, 4)])
+
+    def test_len_and_bounds(self):
+        s = Sequence.create("1-10, 14, 20-48x4")
+        self.assertEqual(len(s), 19)
+        self.assertEqual(s.start, 1)
+        self.assertEqual(s.end, 48)
+
+    def test_indexing_across_runs(self):
+        s = Sequence.create("1-10, 14, 20-48x4")
+        frames = list(s)
+        for i in range(-len(frames), len(frames)):
+            self.assertEqual(s[i], frames[i])
+
+    def test_index_out_of_range(self):
+        s = Sequence.create("1-10, 14")
+        with self.assertRaises(IndexError):
+            s[11]
+
+    def test_linear_chunk_across_runs_is_progression(self):
+        s = Sequence.create("1-2, 4-8x2", chunk_size=3)
+        chunks = s.chunks()
+        self.assertEqual(list(chunks[0]), [1, 2, 4])
+        self.assertEqual(list(chunks[1]), [6, 8])
+        self.assertIsInstance(chunks[1], Progression)
+
+    def test_cycle_chunks_of_irregular_sequence(self):
+        s = Sequence.create("1-10, 14, 20-48x4", chunk_size=4)
+        s.chunk_strategy = "cycle"
+        frames = list(s)
+        num = s.chunk_count()
+        result = [list(c) for c in s.chunks()]
+        self.assertEqual(result, [frames[i::num] for i in range(num)])
+
+    def test_run_table_is_typed_arrays(self):
+        s = Sequence.create("1-10, 14, 20-48x4")
+        self.assertIsInstance(s._iterable._starts, array.array)
+        self.assertEqual(s._iterable._steps.typecode, "q")
+
+    def test_huge_frames_fall_back_to_lists(self):
+        big = 2 ** 70
+        s = Sequence.create([1, 5, big, big + 1])
+        self.assertEqual(list(s), [1, 5, big, big + 1])
+        self.assertIn(big + 1, s)
+
+    def test_no_instance_dict(self):
+        s = Sequence.create("1-10, 14", chunk_size=3)
+        for obj in [s, s.chunks()[0], s.chunks()[-1], Sequence.create("1-10")]:
+            self.assertFalse(hasattr(obj, "__dict__"))
+
+
+class FrameBitmapTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        self.frames = [f for f in range(-1000, 80000) if rnd.random() < 0.5]
+        self.other = [f for f in range(-1000, 80000) if rnd.random() < 0.1]
+        self.s = Sequence.create(self.frames)
+
+    def test_dense_irregular_frames_use_bitmap(self):
+        self.assertIsInstance(self.s._iterable, _FrameBitmap)
+        self.assertIsInstance(Sequence.create(self.other)._iterable, _FrameBitmap)
+
+    def test_all_but_failures_use_runs(self):
+        failures = set(range(0, 80000, 997))
+        s = Sequence.create([f for f in range(80000) if f not in failures])
+        self.assertIsInstance(s._iterable, _FrameRuns)
+
+    def test_generator_operands_are_read_once(self):
+        # Too spread out to make a bitmap of, so runs are merged instead.
+        far = [10 ** 9 + k * 70000 for k in range(1000)]
+        union = self.s.union(frame for frame in far)
+        self.assertEqual(len(union), len(self.frames) + len(far))
+        self.assertTrue(self.s.intersects(f for f in far + [self.frames[7]]))
+        common = self.s.intersection(f for f in far + [self.frames[7]])
+        self.assertEqual(list(common), [self.frames[7]])
+        diff = self.s.difference(f for f in far + [self.frames[7]])
+        self.assertEqual(len(diff), len(self.frames) - 1)
+        self.s.chunk_size = 100
+        chunks = self.s.intersecting_chunks(f for f in far + [self.frames[7]])
+        self.assertEqual(len(chunks), 1)
+
+    def test_intersecting_chunks_does_not_list_runs(self):
+        self.s.chunk_size = 100
+        query = [self.frames[0], self.frames[5000], self.frames[5001] + 1, 90000]
+        expected = [str(c) for c in self.s.chunks() if c.intersects(query)]
+        with patch.object(Sequence, "_runs", side_effect=AssertionError):
+            result = self.s.intersecting_chunks(query)
+        self.assertEqual([str(c) for c in result], expected)
+
+    def test_same_frames_and_spec_as_runs(self):
+        runs = _FrameRuns(self.s._runs())
+        self.assertEqual(list(self.s), list(runs))
+        self.assertEqual(len(self.s), len(self.frames))
+        self.assertEqual(list(self.s), self.frames)
+        self.assertEqual(str(self.s), str(Sequence.create(str(self.s))))
+        self.assertEqual(self.s.start, self.frames[0])
+        self.assertEqual(self.s.end, self.frames[-1])
+
+    def test_contains(self):
+        members = set(self.frames)
+        for frame in range(-1100, 80100, 7):
+            self.assertEqual(frame in self.s, frame in members)
+
+    def test_indexing(self):
+        for i in list(range(-5, 5)) + list(range(0, len(self.frames), 997)):
+            self.assertEqual(self.s[i], self.frames[i])
+            index = self.s._iterable.index(self.frames[i])
+            self.assertEqual(index, i % len(self.frames))
+        with self.assertRaises(IndexError):
+            self.s[len(self.frames)]
+
+    def test_set_operations(self):
+        mine, theirs = set(self.frames), set(self.other)
+        other = Sequence.create(self.other)
+        self.assertEqual(list(self.s.intersection(other)), sorted(mine & theirs))
+        self.assertEqual(list(self.s.union(other)), sorted(mine | theirs))
+        self.assertEqual(list(self.s.difference(other)), sorted(mine - theirs))
+        self.assertTrue(self.s.intersects(other))
+
+    def test_set_operations_with_runs(self):
+        mine = set(self.frames)
+        span = set(range(1000, 90001, 3))
+        self.assertEqual(
+            list(self.s.intersection("1000-90000x3")), sorted(mine & span)
+        )
+        self.assertEqual(list(self.s.union("1000-90000x3")), sorted(mine | span))
+        self.assertEqual(
+            list(self.s.difference("1000-90000x3")), sorted(mine - span)
+        )
+        self.assertEqual(
+            list(Sequence.create("1000-90000x3").difference(self.s)),
+            sorted(span - mine),
+        )
+
+    def test_small_result_uses_runs(self):
+        result = self.s.intersection("10-20")
+        self.assertNotIsInstance(result._iterable, _FrameBitmap)
+        self.assertEqual(list(result), [f for f in self.frames if 10 <= f <= 20])
+
+    def test_chunks(self):
+        self.s.chunk_size = 1000
+        chunks = self.s.chunks()
+        self.assertEqual(len(chunks), (len(self.frames) + 999) // 1000)
+        self.assertEqual([f for c in chunks for f in c], self.frames)
+        self.assertEqual(list(chunks[3]), self.frames[3000:4000])
+
 
 class SequenceIteratorTest(unittest.TestCase):
     def test_iterator_sorted_no_dups(self):
@@ -485,6 +1361,75 @@ class ProgressionsTest(unittest.TestCase):
         progs = Progression.factory(s, max_size=4)
         self.assertEqual(len(progs), 6)
 
+    def test_singles_paired_in_order(self):
+        result = Progression.factory([1, 2, 4, 8, 16, 17, 18, 40])
+        self.assertEqual(
+            [str(p) for p in result], ["1-2", "4-8x4", "16-18", "40"]
+        )
+
+    def test_sequence_and_list_agree(self):
+        frames = [1, 2, 3, 5, 7, 9, 10, 20, 21, 22, 30, 45, 46, 80]
+        s = Sequence.create(frames)
+        for max_size in [-1, 2, 3, 5]:
+            expected = [str(p) for p in Progression.factory(frames, max_size=max_size)]
+            result = [str(p) for p in Progression.factory(s, max_size=max_size)]
+            self.assertEqual(result, expected)
+
+    def test_huge_run_split_by_max_size(self):
+        s = Sequence.create("1-1000000000, 1000000005")
+        progs = Progression.factory(s, max_size=250000000)
+        self.assertEqual(len(progs), 5)
+        self.assertEqual(str(progs[-1]), "1000000005")
+
+
+class OptimalProgressionsTest(unittest.TestCase):
+    def test_shorter_than_greedy(self):
+        s = Sequence.create([1, 3, 5, 6, 7, 8, 9, 10, 11, 1000])
+        self.assertEqual(str(s), "1-5x2,6-11,1000")
+        self.assertEqual(s.spec(mode="optimal"), "1,3,5-11,1000")
+
+    def test_distant_singles_are_not_paired(self):
+        s = Sequence.create([1, 2, 4, 8, 16, 17, 18, 40])
+        self.assertEqual(s.spec(mode="optimal"), "1-2,4,8,16-18,40")
+
+    def test_progressions_are_consecutive(self):
+        # Interleaved progressions such as 1-9x2,4 are not searched.
+        s = Sequence.create([1, 3, 4, 5, 7, 9])
+        self.assertEqual(s.spec(mode="optimal"), "1,3-5,7,9")
+        s = Sequence.create(list(range(1, 100, 2)) + [50])
+        self.assertEqual(s.spec(mode="optimal"), "1-49x2,50,51-99x2")
+
+    def test_long_runs_are_not_expanded(self):
+        s = Sequence.create("1-1000000000000x2, 1000000000001-2000000000000, 3000000000000")
+        progs = Progression.factory(s, mode="optimal", budget=len(s))
+        self.assertEqual(
+            ",".join(str(p) for p in progs),
+            "1-999999999999x2,1000000000001-2000000000000,3000000000000",
+        )
+
+    def test_round_trip(self):
+        s = Sequence.create("1-10, 14, 20-48x4, 50-53, 99")
+        result = Sequence.create(s.spec(mode="optimal"))
+        self.assertEqual(list(result), list(s))
+
+    def test_respects_max_size(self):
+        progs = Progression.factory(range(1, 21), mode="optimal", max_size=6)
+        self.assertEqual(len(progs), 4)
+        self.assertTrue(all(len(p) <= 6 for p in progs))
+
+    def test_falls_back_to_greedy_over_budget(self):
+        frames = [1, 3, 5, 6, 7, 8, 9, 10, 11, 1000]
+        progs = Progression.factory(frames, mode="optimal", budget=5)
+        self.assertEqual([str(p) for p in progs], ["1-5x2", "6-11", "1000"])
+
+    def test_greedy_spec_is_str(self):
+        s = Sequence.create("1-10, 14, 20-48x4")
+        self.assertEqual(s.spec(), str(s))
+
+    def test_bad_mode_raises(self):
+        with self.assertRaises(ValueError):
+            Progression.factory([1, 2, 3], mode="best")
+
 
 class PermutationsTest(unittest.TestCase):
     def test_one_substitution(self):
@@ -510,6 +1455,50 @@ class PermutationsTest(unittest.TestCase):
         self.assertIn("image_02_01.0010.tif", result)
         self.assertEqual(len(result), 8)
 
+    def test_order_is_last_keyword_fastest(self):
+        template = "%(cam)d_%(frame)d"
+        result = list(Sequence.permutations(template, cam="1-2", frame="5-6"))
+        self.assertEqual(result, ["1_5", "1_6", "2_5", "2_6"])
+
+    def test_len_and_indexing(self):
+        template = "cam%(cam)d/%(layer)s.%(frame)04d.exr"
+        kw = {"cam": "1-3", "layer": "7, 9", "frame": "1-10, 20-30x5"}
+        space = Sequence.permutations(template, **kw)
+        result = list(space)
+        self.assertEqual(len(space), 3 * 2 * 13)
+        self.assertEqual(len(result), len(space))
+        self.assertEqual([space[i] for i in range(len(space))], result)
+        self.assertEqual(space[-1], "cam3/9.0030.exr")
+        with self.assertRaises(IndexError):
+            space[len(space)]
+
+    def test_shards_cover_all_in_order(self):
+        space = Sequence.permutations("%(a)d-%(b)d", a="1-5", b="1-7x2")
+        result = list(space)
+        for n in [1, 2, 3, 7, 40]:
+            shards = [space.shard(k, n) for k in range(n)]
+            self.assertEqual(sum(len(shard) for shard in shards), len(result))
+            self.assertEqual([name for shard in shards for name in shard], result)
+
+    def test_shard_indexing(self):
+        space = Sequence.permutations("%(a)d-%(b)d", a="1-5", b="1-7x2")
+        shard = space.shard(2, 3)
+        self.assertEqual(shard[0], space[len(space) * 2 // 3])
+        self.assertEqual(list(shard.shard(1, 2)), list(shard)[len(shard) // 2 :])
+
+    def test_bad_shard(self):
+        space = Sequence.permutations("%(a)d", a="1-5")
+        with self.assertRaises(ValueError):
+            space.shard(3, 3)
+
+    def test_sequence_values(self):
+        space = Sequence.permutations("%(a)02d", a=Sequence.create("3-5"))
+        self.assertEqual(list(space), ["03", "04", "05"])
+
+    def test_literal_percent_and_unused_keyword(self):
+        space = Sequence.permutations("100%% %(a)d", a="1-2", b="1-2")
+        self.assertEqual(list(space), ["100% 1", "100% 1", "100% 2", "100% 2"])
+
 
 class OffsetTest(unittest.TestCase):
     def test_offset_positive_value(self):
@@ -673,6 +1662,89 @@ class ResolveFormatTest(unittest.TestCase):
         self.assertIn("/folder_3/image.03.exr", result)
 
 
+class IterExpandTest(unittest.TestCase):
+    def setUp(self):
+        self.s = Sequence.create("1-10, 14, 20-48x4")
+
+    def test_iter_expand(self):
+        template = "/dir_###/image.####.exr"
+        self.assertEqual(list(self.s.iter_expand(template)), self.s.expand(template))
+
+    def test_iter_expand_format(self):
+        templates = ["a/{frame:02d}.exr", "b/{frame}.exr"]
+        self.assertEqual(
+            list(self.s.iter_expand_format(*templates)),
+            self.s.expand_format(*templates),
+        )
+
+    def test_iter_expand_dollar_f(self):
+        templates = ["a/$2F.exr", "b/$F3.exr", "c/$F.exr"]
+        self.assertEqual(
+            list(self.s.iter_expand_dollar_f(*templates)),
+            self.s.expand_dollar_f(*templates),
+        )
+
+    def test_bad_template_raises_before_iterating(self):
+        with self.assertRaises(ValueError):
+            self.s.iter_expand("image.exr")
+
+    def test_expand_to(self):
+        for template, style, expand in [
+            ("/dir_###/image.####.exr", "hash", self.s.expand),
+            ("image.####.exr", "hash", self.s.expand),
+            ("image.{frame:>4}.exr", "format", self.s.expand_format),
+            ("image.$2F.exr", "dollar", self.s.expand_dollar_f),
+        ]:
+            stream = io.StringIO()
+            count = self.s.expand_to(stream, template, style=style, block_size=3)
+            expected = expand(template)
+            self.assertEqual(count, len(self.s))
+            self.assertEqual(stream.getvalue(), "".join(f + "\n" for f in expected))
+
+    def test_expand_to_progression(self):
+        stream = io.StringIO()
+        Sequence.create(1, 3).expand_to(stream, "image.#.exr")
+        self.assertEqual(stream.getvalue(), "image.1.exr\nimage.2.exr\nimage.3.exr\n")
+
+
+class CompileTemplateTest(unittest.TestCase):
+    def test_hash(self):
+        template = compile_template("/dir_###/image.#####.exr")
+        self.assertEqual(template.format(12), "/dir_012/image.00012.exr")
+        self.assertEqual(template.format(-3), "/dir_-03/image.-0003.exr")
+
+    def test_dollar(self):
+        template = compile_template("image.$2F.$f3.{frame}.exr", "dollar")
+        self.assertEqual(template.format(7), "image.07.007.7.exr")
+
+    def test_format(self):
+        template = compile_template("image.{frame:04d}.{frame:>3}.exr", "format")
+        self.assertEqual(template.format(7), "image.0007.  7.exr")
+
+    def test_literal_braces_and_percents_in_hash_template(self):
+        template = compile_template("{dir}/100%/image.##.exr")
+        self.assertEqual(template.format(5), "{dir}/100%/image.05.exr")
+
+    def test_expand(self):
+        template = compile_template("image.##.exr")
+        self.assertEqual(template.expand([1, 2]), ["image.01.exr", "image.02.exr"])
+
+    def test_cached(self):
+        self.assertIs(compile_template("image.#.exr"), compile_template("image.#.exr"))
+        self.assertIsNot(
+            compile_template("image.$F.exr", "dollar"),
+            compile_template("image.$F.exr", "format"),
+        )
+
+    def test_bad_templates(self):
+        with self.assertRaises(ValueError):
+            compile_template("image.exr")
+        with self.assertRaises(ValueError):
+            compile_template("image.#.exr", "glob")
+        with self.assertRaises(KeyError):
+            compile_template("{shot}.{frame}", "format").format(1)
+
+
 class ToCustomSpecTest(unittest.TestCase):
     def test_spec_single_number(self):
         s = Sequence.create(10)
@@ -698,6 +1770,14 @@ class ToCustomSpecTest(unittest.TestCase):
         s = Sequence.create("1-4, 6-10x2, 20-28x4")
         self.assertEqual(s.to("-", "", ","), "1-4,6,8,10,20,24,28")
 
+    def test_negative_frames(self):
+        s = Sequence.create("-10--2x2, 3-9x3")
+        self.assertEqual(s.to(":", "%", ";"), "-10:-2%2;3:9%3")
+
+    def test_progression_no_step(self):
+        s = Sequence.create("1-9x4")
+        self.assertEqual(s.to(":", "", " "), "1 5 9")
+
 
 class SubsampleTest(unittest.TestCase):
     def test_counts_from_1_to_10(self):
@@ -816,6 +1896,14 @@ class CalcFMLTest(unittest.TestCase):
         self.assertEqual(len(ss), 11)
         self.assertEqual(list(ss), list(s))
 
+    def test_full_sequence_keeps_chunk_settings(self):
+        s = Sequence.create("1-5, 9-11x2", chunk_size=2, chunk_strategy="cycle")
+        ss = s.calc_fml(20)
+        self.assertIsNot(ss, s)
+        self.assertEqual(list(ss), list(s))
+        self.assertEqual(ss.chunk_size, 2)
+        self.assertEqual(ss.chunk_strategy, "cycle")
+
 
 class IndexingTest(unittest.TestCase):
     def test_spec_single_number(self):
@@ -828,43 +1916,319 @@ class IndexingTest(unittest.TestCase):
 
 
 class CreateFromFilenames(unittest.TestCase):
-    @patch("cioseq.sequence.glob")
-    def test_basic(self, mock_glob):
+    @patch("cioseq.sequence._list_directory")
+    def test_basic(self, mock_list):
         filenames = ["image.0001.exr", "image.0002.exr", "image.0003.exr"]
-        mock_glob.return_value = filenames
+        mock_list.return_value = filenames
         s = Sequence.create(prefix="image.", extension=".exr")
         self.assertEqual(list(s), [1, 2, 3])
 
-    @patch("cioseq.sequence.glob")
-    def test_when_other_files_exist(self, mock_glob):
+    @patch("cioseq.sequence._list_directory")
+    def test_when_other_files_exist(self, mock_list):
         filenames = [
             "image.0001.exr",
             "image.0002.exr",
             "image.0003.exr",
             "image2.0004.exr",
         ]
-        mock_glob.return_value = filenames
+        mock_list.return_value = filenames
         s = Sequence.create(prefix="image.", extension=".exr")
         self.assertEqual(list(s), [1, 2, 3])
 
-    @patch("cioseq.sequence.glob")
-    def test_raises_when_no_files_exist(self, mock_glob):
-        mock_glob.return_value = []
+    @patch("cioseq.sequence._list_directory")
+    def test_raises_when_no_files_exist(self, mock_list):
+        mock_list.return_value = []
         with self.assertRaises(ValueError):
             s = Sequence.create(prefix="image.", extension=".exr")
 
-    @patch("cioseq.sequence.glob")
-    def test_raises_if_no_files_with_a_number(self, mock_glob):
-        mock_glob.return_value = ["image.exr", "foo.exr", "bar.exr", "yum.exr"]
+    @patch("cioseq.sequence._list_directory")
+    def test_raises_if_no_files_with_a_number(self, mock_list):
+        mock_list.return_value = ["image.exr", "foo.exr", "bar.exr", "yum.exr"]
         with self.assertRaises(ValueError):
             s = Sequence.create(prefix="image.", extension=".exr")
 
-    @patch("cioseq.sequence.glob")
-    def test_no_prefix(self, mock_glob):
-        mock_glob.return_value = ["001.exr", "002.exr", "003.exr", "yum.exr"]
+    @patch("cioseq.sequence._list_directory")
+    def test_no_prefix(self, mock_list):
+        mock_list.return_value = ["001.exr", "002.exr", "003.exr", "yum.exr"]
         s = Sequence.create(prefix="", extension=".exr")
         self.assertEqual(list(s), [1, 2, 3])
 
+    @patch("cioseq.sequence._list_directory")
+    def test_lists_the_prefix_directory(self, mock_list):
+        mock_list.return_value = ["image.0001.exr", "image.0002.exr.bak"]
+        s = Sequence.create(prefix="/path/to/image.", extension=".exr")
+        mock_list.assert_called_once_with("/path/to")
+        self.assertEqual(list(s), [1])
+
+    def test_raises_when_directory_is_missing(self):
+        with self.assertRaises(ValueError):
+            Sequence.create(prefix="/no/such/dir/image.", extension=".exr")
+
+
+class FrameScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        names = [
+            "image.0001.exr",
+            "image.0002.exr",
+            "image.0010.exr",
+            "image.0001.jpg",
+            "image.exr",
+            "image.00a1.exr",
+            "image2.0003.exr",
+            "0007.exr",
+        ]
+        for name in names:
+            open(os.path.join(self.directory, name), "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_frames(self):
+        scanner = FrameScanner(self.directory)
+        self.assertEqual(sorted(scanner.frames("image.", ".exr")), [1, 2, 10])
+
+    @patch("cioseq.sequence._list_directory")
+    def test_find_answers_several_queries_from_one_listing(self, mock_list):
+        mock_list.return_value = os.listdir(self.directory)
+        scanner = FrameScanner(self.directory)
+        found = scanner.find([("image.", ".exr"), ("image.", ".jpg"), ("", ".exr")])
+        self.assertEqual(scanner.frames("image2.", ".exr"), [3])
+        mock_list.assert_called_once_with(self.directory)
+        self.assertEqual(sorted(found[("image.", ".exr")]), [1, 2, 10])
+        self.assertEqual(found[("image.", ".jpg")], [1])
+        self.assertEqual(found[("", ".exr")], [7])
+
+    def test_missing_directory_has_no_names(self):
+        scanner = FrameScanner(os.path.join(self.directory, "missing"))
+        self.assertEqual(scanner.names(), [])
+        self.assertEqual(scanner.frames("image.", ".exr"), [])
+
+    def test_create_from_directory(self):
+        prefix = os.path.join(self.directory, "image.")
+        s = Sequence.create(prefix=prefix, extension=".exr")
+        self.assertEqual(str(s), "1-2,10")
+
+
+class ListingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.directory, "image.")
+        for frame in [1, 2, 3]:
+            self.touch(frame)
+        enable_listing_cache()
+        clear_listing_cache()
+
+    def tearDown(self):
+        disable_listing_cache()
+        shutil.rmtree(self.directory)
+
+    def touch(self, frame):
+        open("%s%04d.exr" % (self.prefix, frame), "w").close()
+        # Back date the directory so its listing is not too fresh to cache.
+        old = time.time() - 100 + frame
+        os.utime(self.directory, (old, old))
+
+    def create(self):
+        return str(Sequence.create(prefix=self.prefix, extension=".exr"))
+
+    def test_hit_on_unchanged_directory(self):
+        self.assertEqual(self.create(), "1-3")
+        self.assertEqual(self.create(), "1-3")
+        info = listing_cache_info()
+        self.assertEqual((info.hits, info.misses, info.size), (1, 1, 1))
+
+    def test_miss_when_directory_changes(self):
+        self.create()
+        self.touch(4)
+        self.assertEqual(self.create(), "1-4")
+        self.assertEqual(listing_cache_info().misses, 2)
+
+    def test_fresh_directory_is_not_cached(self):
+        open("%s%04d.exr" % (self.prefix, 5), "w").close()
+        self.assertEqual(self.create(), "1-3,5")
+        self.assertEqual(self.create(), "1-3,5")
+        info = listing_cache_info()
+        self.assertEqual((info.hits, info.size), (0, 0))
+
+    def test_limit(self):
+        enable_listing_cache(limit=2)
+        directories = [tempfile.mkdtemp(dir=self.directory) for _ in range(3)]
+        os.utime(self.directory, (0, 0))
+        for directory in directories:
+            os.utime(directory, (0, 0))
+            FrameScanner(directory).names()
+        self.assertEqual(listing_cache_info().size, 2)
+        FrameScanner(directories[0]).names()
+        self.assertEqual(listing_cache_info().hits, 0)
+        FrameScanner(directories[2]).names()
+        self.assertEqual(listing_cache_info().hits, 1)
+
+    def test_disable(self):
+        self.create()
+        disable_listing_cache()
+        self.create()
+        self.assertEqual(listing_cache_info(), (0, 0, 0, 0))
+
+    def test_bad_limit(self):
+        with self.assertRaises(ValueError):
+            enable_listing_cache(limit=0)
+
+    def test_find_sequences_uses_cache(self):
+        list(find_sequences(self.directory))
+        found = dict(find_sequences(self.directory))
+        self.assertEqual(str(found[self.directory][("image.", 4, ".exr")]), "1-3")
+        self.assertEqual(listing_cache_info().hits, 1)
+
+
+class OnDiskTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, size=1):
+        path = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as fh:
+            fh.write("x" * size)
+
+    def test_missing_and_present(self):
+        for frame in [1, 2, 3, 7, 12]:
+            self.write("image.%04d.exr" % frame)
+        self.write("image.00005.exr")
+        self.write("image.0006.exr.tmp")
+        self.write("image.0004.jpg")
+        template = os.path.join(self.directory, "image.####.exr")
+        s = Sequence.create("1-10")
+        self.assertEqual(str(s.present_on_disk(template)), "1-3,7")
+        self.assertEqual(str(s.missing_on_disk(template)), "4-6,8-10")
+
+    def test_all_present_or_missing(self):
+        self.write("image.1.exr")
+        template = os.path.join(self.directory, "image.#.exr")
+        s = Sequence.create("1")
+        self.assertIsNone(s.missing_on_disk(template))
+        self.assertEqual(list(s.present_on_disk(template)), [1])
+        template = os.path.join(self.directory, "missing", "image.#.exr")
+        self.assertIsNone(s.present_on_disk(template))
+        self.assertEqual(list(s.missing_on_disk(template)), [1])
+
+    def test_keeps_chunk_size(self):
+        s = Sequence.create("1-10", chunk_size=3)
+        missing = s.missing_on_disk(os.path.join(self.directory, "image.#.exr"))
+        self.assertEqual(missing.chunk_size, 3)
+
+    def test_hashes_in_directory(self):
+        for frame in [1, 2, 4]:
+            self.write(os.path.join("%03d" % frame, "image.%04d.exr" % frame))
+        self.write(os.path.join("001", "image.0003.exr"))
+        self.write(os.path.join("005", "image.exr"))
+        s = Sequence.create("1-5")
+        template = os.path.join(self.directory, "###", "image.####.exr")
+        self.assertEqual(list(s.missing_on_disk(template)), [3, 5])
+        template = os.path.join(self.directory, "###", "image.exr")
+        self.assertEqual(str(s.present_on_disk(template)), "5")
+
+    def test_min_size(self):
+        for frame in range(1, 6):
+            self.write("image.%04d.exr" % frame, size=10 if frame % 2 else 0)
+        template = os.path.join(self.directory, "image.####.exr")
+        s = Sequence.create("1-6")
+        self.assertEqual(str(s.missing_on_disk(template, min_size=1)), "2-6x2")
+        self.assertEqual(str(s.present_on_disk(template, min_size=0)), "1-5")
+
+    def test_raises_without_hashes(self):
+        with self.assertRaises(ValueError):
+            Sequence.create("1-10").missing_on_disk("image.exr")
+
+
+class FindSequencesTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        files = {
+            "": ["readme.txt", "plate.1001.exr", "plate.1002.exr"],
+            "render": ["beauty.%04d.exr" % f for f in range(1, 11)]
+            + ["beauty.%04d.exr" % 10000, "beauty.1.jpg", "beauty.3.jpg"]
+            + ["beauty.8.png", "beauty.10.png"],
+            os.path.join("render", "empty"): [],
+            os.path.join("render", "notes"): ["notes.txt"],
+            os.path.join("comp", "v002"): ["sh010_v002.%03d.png" % f for f in [1, 3, 5]]
+            + ["sh010_v002.%04d.png" % f for f in [7, 8]],
+        }
+        for directory, names in files.items():
+            path = os.path.join(self.root, directory)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            for name in names:
+                open(os.path.join(path, name), "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def found(self, **kw):
+        result = {}
+        for directory, sequences in find_sequences(self.root, **kw):
+            self.assertNotIn(directory, result)
+            relative = os.path.relpath(directory, self.root)
+            result[relative] = {key: str(seq) for key, seq in sequences.items()}
+        return result
+
+    def test_finds_sequences_in_all_directories(self):
+        self.assertEqual(
+            self.found(),
+            {
+                ".": {("plate.", 4, ".exr"): "1001-1002"},
+                "render": {
+                    ("beauty.", 4, ".exr"): "1-10,10000",
+                    ("beauty.", 1, ".jpg"): "1-3x2",
+                    ("beauty.", 1, ".png"): "8-10x2",
+                },
+                os.path.join("comp", "v002"): {
+                    ("sh010_v002.", 3, ".png"): "1-5x2",
+                    ("sh010_v002.", 4, ".png"): "7-8",
+                },
+            },
+        )
+
+    def test_one_worker(self):
+        self.assertEqual(self.found(max_workers=1), self.found())
+
+    def test_stop_early(self):
+        for directory, sequences in find_sequences(self.root):
+            break
+        self.assertTrue(sequences)
+
+    def test_missing_root(self):
+        self.assertEqual(list(find_sequences(os.path.join(self.root, "no"))), [])
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "needs symlinks")
+    def test_links_to_directories_are_not_followed(self):
+        os.symlink(self.root, os.path.join(self.root, "render", "loop"))
+        self.assertEqual(len(self.found()), 3)
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "needs symlinks")
+    def test_followed_links_do_not_loop(self):
+        os.symlink(self.root, os.path.join(self.root, "render", "loop"))
+        os.symlink(
+            os.path.join(self.root, "comp"), os.path.join(self.root, "render", "comp")
+        )
+        # comp/v002 is scanned once, through either path.
+        found = self.found(followlinks=True)
+        self.assertEqual(len(found), 3)
+        self.assertEqual(sorted(found)[:1], ["."])
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "needs symlinks")
+    def test_followed_links_outside_root(self):
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        open(os.path.join(outside, "shot.0001.exr"), "w").close()
+        os.symlink(outside, os.path.join(self.root, "render", "outside"))
+        found = self.found(followlinks=True)
+        self.assertIn(os.path.join("render", "outside"), found)
+
 
 if __name__ == "__main__":
     unittest.main()